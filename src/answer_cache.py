@@ -0,0 +1,47 @@
+import re
+from src.cache import TTLCache
+from src.config import LLM_CONFIG
+from src.database import get_services_version
+
+_WORD_RE = re.compile(r"\w+")
+
+def normalize_question(text: str) -> str:
+    """Lowercases, folds ё to е and drops punctuation so trivial variants share a key."""
+    return " ".join(_WORD_RE.findall(text.lower().replace("ё", "е")))
+
+class AnswerCache:
+    """
+    Caches LLM answers to short opening questions ("сколько стоит бот").
+    Keyed by (normalized question, persona combination, services version),
+    so a persona keeps its own voice and a catalog change invalidates
+    everything. Only context-free turns qualify: no prior history and no
+    saved contact, which rules out any booking state.
+    """
+    def __init__(self, enabled: bool = None, max_entries: int = None, ttl: float = None, max_question_chars: int = None):
+        cache_config = LLM_CONFIG.get("answer_cache", {})
+        self.enabled = enabled if enabled is not None else cache_config.get("enabled", False)
+        self.max_question_chars = max_question_chars if max_question_chars is not None else cache_config.get("max_question_chars", 80)
+        self._cache = TTLCache(
+            max_entries=max_entries if max_entries is not None else cache_config.get("max_entries", 512),
+            ttl=ttl if ttl is not None else cache_config.get("ttl", 3600)
+        )
+
+    def _key(self, question, persona, history, user_data):
+        if not self.enabled or history or user_data:
+            return None
+        normalized = normalize_question(question or "")
+        if not normalized or len(normalized) > self.max_question_chars:
+            return None
+        return (normalized, persona["mood"], persona["style"], persona["thought"], get_services_version())
+
+    def get(self, question, persona, history, user_data):
+        key = self._key(question, persona, history, user_data)
+        return self._cache.get(key) if key is not None else None
+
+    def put(self, question, persona, history, user_data, answer):
+        key = self._key(question, persona, history, user_data)
+        if key is not None:
+            self._cache.set(key, answer)
+
+    def stats(self):
+        return self._cache.stats()
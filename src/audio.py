@@ -1,43 +1,74 @@
 import os
+import io
+import asyncio
+from typing import NamedTuple, Optional
 from openai import AsyncOpenAI
 from src.config import LLM_CONFIG
-from pydub import AudioSegment
+from src.transcode import transcode_pool
+from src.tts_cache import TTSCache
+from src.silence import trim_silence, split_at_pauses, pcm_duration
 import edge_tts
 import re
-import emoji
+from src.text import clean_markdown_for_tts
+from src.metrics import timer, STAGE_SECONDS
 
-def clean_markdown_for_tts(text: str) -> str:
-    """
-    Removes Markdown formatting and Emojis from text for cleaner TTS output.
-    Keeps only the human-readable content.
-    """
-    if not text:
-        return ""
-
-    # Remove Emojis
-    text = emoji.replace_emoji(text, replace='')
+# Upload encodings for preprocessed STT audio: extension -> ffmpeg output args
+STT_UPLOAD_FORMATS = {
+    "ogg": ("-c:a", "libopus", "-f", "ogg"),
+    "flac": ("-f", "flac"),
+    "wav": ("-f", "wav"),
+}
 
-    # Remove bold/italic (**text**, *text*, __text__, _text_)
-    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
-    text = re.sub(r'\*([^*]+)\*', r'\1', text)
-    text = re.sub(r'__([^_]+)__', r'\1', text)
-    text = re.sub(r'_([^_]+)_', r'\1', text)
+OVERLAP_PUNCTUATION = ".,!?…:;\"'«»()-—"
 
-    # Remove code blocks (```code```) and inline code (`code`)
-    text = re.sub(r'```[\s\S]*?```', '', text) # Remove code blocks entirely or keep content? usually best to remove or simplify
-    text = re.sub(r'`([^`]+)`', r'\1', text)
-
-    # Remove links [text](url) -> text
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+def stitch_transcripts(parts: list, max_overlap_words: int = 8) -> str:
+    """
+    Joins chunk transcripts in order. Chunks overlap in time, so the words a
+    chunk starts with may repeat the end of the previous one; the longest
+    such repeat (ignoring case and punctuation) is dropped.
+    """
+    words = []
+    for part in parts:
+        new_words = part.split()
+        if words and new_words:
+            tail = [w.strip(OVERLAP_PUNCTUATION).lower() for w in words[-max_overlap_words:]]
+            head = [w.strip(OVERLAP_PUNCTUATION).lower() for w in new_words[:max_overlap_words]]
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    new_words = new_words[size:]
+                    break
+        words.extend(new_words)
+    return " ".join(words)
 
-    # Remove headers (# Header)
-    text = re.sub(r'#+\s?', '', text)
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|\n+')
 
-    # Remove lists markers (-, *, 1.)
-    text = re.sub(r'^\s*[-*]\s+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
+def split_sentences(text: str, min_chars: int = 200, max_chars: int = 600) -> list:
+    """
+    Splits text at sentence boundaries into chunks for parallel synthesis.
+    Short sentences are merged until a chunk reaches min_chars so prosody
+    isn't broken up needlessly; no chunk grows past max_chars unless a
+    single sentence is longer.
+    """
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and (len(current) >= min_chars or len(current) + len(sentence) + 1 > max_chars):
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
 
-    return text.strip()
+class VoiceReply(NamedTuple):
+    """A synthesized reply: either a Telegram file_id to resend, or Opus bytes to upload."""
+    key: str
+    file_id: Optional[str]
+    data: Optional[bytes]
 
 class AudioClient:
     def __init__(self):
@@ -48,13 +79,75 @@ class AudioClient:
             base_url=provider_config.get("base_url", "https://api.groq.com/openai/v1"),
             api_key=os.getenv("GROQ_API_KEY")
         )
-        self.model = LLM_CONFIG.get("stt", {}).get("model", "whisper-large-v3-turbo")
-        self.tts_voice = "ru-RU-SvetlanaNeural"
+        stt_config = LLM_CONFIG.get("stt", {})
+        self.model = stt_config.get("model", "whisper-large-v3-turbo")
+        self.sample_rate = stt_config.get("sample_rate", 16000)
+        self.trim_silence = stt_config.get("trim_silence", True)
+        self.silence_threshold_db = stt_config.get("silence_threshold_db", -40)
+        self.silence_frame_ms = stt_config.get("silence_frame_ms", 30)
+        self.silence_padding_ms = stt_config.get("silence_padding_ms", 200)
+        self.upload_format = stt_config.get("upload_format", "ogg")
+        if self.upload_format != "original" and self.upload_format not in STT_UPLOAD_FORMATS:
+            print(f"Unknown stt.upload_format '{self.upload_format}', using ogg")
+            self.upload_format = "ogg"
+        chunking_config = stt_config.get("chunking", {})
+        self.chunking_enabled = chunking_config.get("enabled", True)
+        self.chunking_min_seconds = chunking_config.get("min_seconds", 45)
+        self.chunk_seconds = chunking_config.get("chunk_seconds", 30)
+        self.chunk_overlap_seconds = chunking_config.get("overlap_seconds", 1.0)
+        self.chunk_max_parallel = chunking_config.get("max_parallel", 4)
+        self.stt_stats = {
+            "requests": 0, "bytes_in": 0, "bytes_uploaded": 0, "seconds_total": 0.0, "seconds_removed": 0.0,
+            "chunks": 0, "chunk_failures": 0,
+        }
+        tts_config = LLM_CONFIG.get("tts", {})
+        self.tts_voice = tts_config.get("voice", "ru-RU-SvetlanaNeural")
+        self.chunk_min_chars = tts_config.get("chunk_min_chars", 200)
+        self.chunk_max_chars = tts_config.get("chunk_max_chars", 600)
+        # Caps concurrent Edge-TTS sessions across all replies
+        self._tts_sessions = asyncio.Semaphore(tts_config.get("max_concurrent_sessions", 4))
+        self.tts_cache = TTSCache()
+
+    @staticmethod
+    def _prosody(mood):
+        """Rate and pitch for a persona mood."""
+        if mood == "enthusiastic":
+            return "+10%", "+5Hz"
+        if mood in ["cynical", "professional"]:
+            return "-5%", "-2Hz"
+        return "+0%", "+0Hz"
 
-    async def text_to_speech(self, text, output_filename, mood="professional"):
+    async def _synthesize_chunk(self, text, rate, pitch):
+        """Streams Edge-TTS audio (MP3) for one chunk into memory."""
+        async with self._tts_sessions:
+            buffer = io.BytesIO()
+            communicate = edge_tts.Communicate(text, self.tts_voice, rate=rate, pitch=pitch)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    buffer.write(chunk["data"])
+            return buffer.getvalue()
+
+    async def _synthesize(self, text, rate, pitch):
+        """
+        Synthesizes sentence chunks concurrently and joins them in order.
+        Edge-TTS emits headerless MP3 frames, so the chunks concatenate into
+        one stream that is transcoded once.
+        """
+        chunks = split_sentences(text, self.chunk_min_chars, self.chunk_max_chars)
+        if len(chunks) <= 1:
+            return await self._synthesize_chunk(text, rate, pitch)
+
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(self._synthesize_chunk(chunk, rate, pitch)) for chunk in chunks]
+        return b"".join(task.result() for task in tasks)
+
+    async def text_to_speech(self, text, mood="professional", already_clean=False):
         """
-        Converts text to speech using Edge-TTS and saves it to output_filename.
-        Returns the path to the file to send (can be .ogg).
+        Converts text to speech using Edge-TTS.
+        Returns a VoiceReply (cached file_id, or OGG/Opus bytes ready to upload
+        as a Telegram voice message), or None on failure. Identical text,
+        voice and prosody are served from the TTS cache. Pass already_clean
+        when text is the tts output of sanitize_reply.
 
         mood: affects rate and pitch
           - enthusiastic: rate=+10%, pitch=+5Hz
@@ -63,86 +156,160 @@ class AudioClient:
         """
         try:
             # Clean text before sending to TTS
-            clean_text = clean_markdown_for_tts(text)
+            clean_text = text if already_clean else clean_markdown_for_tts(text)
             if not clean_text:
                 return None
 
-            # Edge-TTS output is typically MP3
-            temp_mp3 = output_filename + ".mp3"
+            rate, pitch = self._prosody(mood)
+            key = TTSCache.make_key(clean_text, self.tts_voice, rate, pitch)
 
-            # Determine prosody options based on mood
-            rate = "+0%"
-            pitch = "+0Hz"
+            # Telegram already has this exact audio: send it by id
+            file_id = self.tts_cache.get_file_id(key)
+            if file_id:
+                return VoiceReply(key, file_id, None)
 
-            if mood == "enthusiastic":
-                rate = "+10%"
-                pitch = "+5Hz"
-            elif mood in ["cynical", "professional"]:
-                rate = "-5%"
-                pitch = "-2Hz"
+            data = await self.tts_cache.get(key)
+            if data is None:
+                with timer(STAGE_SECONDS, stage="tts_synthesize"):
+                    mp3_bytes = await self._synthesize(clean_text, rate, pitch)
+                if not mp3_bytes:
+                    return None
 
-            communicate = edge_tts.Communicate(clean_text, self.tts_voice, rate=rate, pitch=pitch)
-            await communicate.save(temp_mp3)
+                # Convert mp3 to ogg (opus) for Telegram voice message compatibility
+                with timer(STAGE_SECONDS, stage="tts_transcode"):
+                    data = await transcode_pool.convert(mp3_bytes, "mp3", "-c:a", "libopus", "-f", "ogg", label="tts")
+                await self.tts_cache.put(key, data)
 
-            # Convert mp3 to ogg (opus) for Telegram voice message compatibility
-            final_path = output_filename
-            if not final_path.endswith(".ogg"):
-                final_path += ".ogg"
+            return VoiceReply(key, None, data)
+        except Exception as e:
+            print(f"TTS Error: {e}")
+            return None
 
-            # Run blocking audio conversion in a separate thread
-            import asyncio
-            def _convert():
-                audio = AudioSegment.from_mp3(temp_mp3)
-                audio.export(final_path, format="ogg", codec="libopus")
+    async def _prepare_uploads(self, audio_bytes: bytes, input_format: str):
+        """
+        Downmixes to mono PCM at sample_rate, trims leading/trailing silence,
+        splits long audio at pauses and re-encodes to the compact upload format.
+        Returns ([(filename, bytes), ...], seconds_total, seconds_removed).
+        """
+        pcm = await transcode_pool.convert(
+            audio_bytes, input_format, "-ac", "1", "-ar", str(self.sample_rate), "-f", "s16le", label="stt"
+        )
+        seconds_total = pcm_duration(pcm, self.sample_rate)
+        if self.trim_silence:
+            pcm = await transcode_pool.run_in_thread(
+                trim_silence, pcm, self.sample_rate,
+                self.silence_threshold_db, self.silence_frame_ms, self.silence_padding_ms,
+                label="stt_trim"
+            )
 
-            await asyncio.to_thread(_convert)
+        seconds_removed = seconds_total - pcm_duration(pcm, self.sample_rate)
 
-            # Clean up temp mp3
-            if os.path.exists(temp_mp3):
-                os.remove(temp_mp3)
+        pieces = [pcm]
+        if self.chunking_enabled and pcm_duration(pcm, self.sample_rate) > self.chunking_min_seconds:
+            pieces = await transcode_pool.run_in_thread(
+                split_at_pauses, pcm, self.sample_rate, self.chunk_seconds, self.chunk_overlap_seconds,
+                self.silence_frame_ms, label="stt_split"
+            )
 
-            return final_path
-        except Exception as e:
-            print(f"TTS Error: {e}")
-            return None
+        encoded = await asyncio.gather(*(
+            transcode_pool.convert(
+                piece, "s16le", *STT_UPLOAD_FORMATS[self.upload_format],
+                label="stt", input_args=("-ar", str(self.sample_rate), "-ac", "1")
+            )
+            for piece in pieces
+        ))
+        uploads = [(f"voice{i}.{self.upload_format}", data) for i, data in enumerate(encoded)]
+        return uploads, seconds_total, seconds_removed
+
+    async def _transcribe_upload(self, upload, semaphore):
+        async with semaphore:
+            transcription = await self.client.audio.transcriptions.create(
+                file=upload,
+                model=self.model,
+                response_format="json"
+            )
+            return transcription.text
 
-    async def transcribe(self, file_path):
+    async def _transcribe_chunks(self, uploads):
         """
-        Transcribes audio file at file_path using Groq's Whisper API.
-        Automatically converts .oga (Telegram voice) to .wav before sending.
+        Transcribes chunks concurrently (at most chunk_max_parallel at once)
+        and stitches them in order. Failed chunks are left out so the user
+        still gets the rest. Returns (text, complete): text is None only if
+        every chunk failed, complete is False if any did.
         """
-        if not os.path.exists(file_path):
-            return None
+        semaphore = asyncio.Semaphore(self.chunk_max_parallel)
+        results = await asyncio.gather(
+            *(self._transcribe_upload(upload, semaphore) for upload in uploads),
+            return_exceptions=True
+        )
+        parts = []
+        failures = 0
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                failures += 1
+                print(f"STT chunk {i + 1}/{len(uploads)} failed: {result}")
+            elif result:
+                parts.append(result)
+        self.stt_stats["chunk_failures"] += failures
+        return (stitch_transcripts(parts) if parts else None), not failures
 
-        converted_path = None
+    async def transcribe(self, audio_bytes: bytes, input_format: str = "ogg"):
+        """
+        Transcribes in-memory audio (Telegram voice notes are OGG/Opus) using Groq's Whisper API.
+        Unless stt.upload_format is "original", the audio is preprocessed first
+        (mono 16 kHz, silence trimmed, compact encoding).
+        Returns (text, complete). complete is False when the request or any
+        chunk failed, so a partial text must not be cached.
+        """
+        if not audio_bytes:
+            return None, False
 
-        # Check if conversion is needed (Groq doesn't like .oga)
-        if file_path.endswith('.oga') or file_path.endswith('.ogg'):
+        seconds_total = seconds_removed = 0.0
+        if self.upload_format == "original":
+            uploads = [(f"voice.{input_format}", audio_bytes)]
+        else:
             try:
-                converted_path = file_path.rsplit('.', 1)[0] + ".wav"
-                # Load audio using pydub (requires ffmpeg installed in system)
-                audio = AudioSegment.from_file(file_path)
-                audio.export(converted_path, format="wav")
-                file_to_send = converted_path
+                with timer(STAGE_SECONDS, stage="stt_convert"):
+                    uploads, seconds_total, seconds_removed = await self._prepare_uploads(audio_bytes, input_format)
             except Exception as e:
-                print(f"Audio Conversion Error: {e}")
-                # Fallback to original file if conversion fails (might still fail at API)
-                file_to_send = file_path
-        else:
-            file_to_send = file_path
+                print(f"Audio Conversion Error: {e!r}")
+                # Fallback to original bytes if conversion fails or the pool is saturated (might still fail at API)
+                uploads = [(f"voice.{input_format}", audio_bytes)]
+
+        bytes_uploaded = sum(len(data) for _, data in uploads)
+        stats = self.stt_stats
+        stats["requests"] += 1
+        stats["bytes_in"] += len(audio_bytes)
+        stats["bytes_uploaded"] += bytes_uploaded
+        stats["seconds_total"] += seconds_total
+        stats["seconds_removed"] += seconds_removed
+
+        if len(uploads) > 1:
+            stats["chunks"] += len(uploads)
+            with timer(STAGE_SECONDS, stage="stt_request"):
+                return await self._transcribe_chunks(uploads)
+        upload = uploads[0]
 
         try:
-            with open(file_to_send, "rb") as audio_file:
+            with timer(STAGE_SECONDS, stage="stt_request"):
                 transcription = await self.client.audio.transcriptions.create(
-                    file=audio_file,
+                    file=upload,
                     model=self.model,
                     response_format="json"
                 )
-            return transcription.text
+            return transcription.text, True
         except Exception as e:
             print(f"STT Error: {e}")
-            return None
-        finally:
-            # Cleanup converted file
-            if converted_path and os.path.exists(converted_path):
-                os.remove(converted_path)
+            return None, False
+
+    async def cached_voice(self, key):
+        """Opus bytes of a cached reply, or None if they were evicted."""
+        return await self.tts_cache.get(key)
+
+    async def remember_file_id(self, key, file_id):
+        """Stores the Telegram file_id of an uploaded reply for reuse."""
+        await self.tts_cache.set_file_id(key, file_id)
+
+    async def forget_file_id(self, key):
+        """Drops a file_id Telegram no longer accepts."""
+        await self.tts_cache.forget_file_id(key)
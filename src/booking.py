@@ -0,0 +1,192 @@
+import re
+import json
+
+# Possible start of a code fence / "json" label at the end of the prose seen so far
+_PARTIAL_PRELUDE_RE = re.compile(r"(?:`{1,3}[ \t]*)?(?:\bj(?:s(?:on?)?)?[ \t]*)?\s*$", re.IGNORECASE)
+# Complete fence / label right before a '{'
+_PRELUDE_RE = re.compile(r"(?:```[ \t]*)?(?:\bjson)?\s*$", re.IGNORECASE)
+_PARTIAL_FENCE_CLOSE_RE = re.compile(r"\s*`{0,2}")
+_FENCE_CLOSE_RE = re.compile(r"\s*```")
+# Only the tail of the prose can be a prelude; never search further back than this
+_PRELUDE_WINDOW = 32
+
+_PROSE, _OBJECT_START, _OBJECT, _AFTER_OBJECT = range(4)
+
+def is_booking_confirmed(data) -> bool:
+    """
+    Strict check of the booking flag (snake_case or merged key): the value
+    must be True or the string "true" in any case; False/"false" are rejected.
+    """
+    def is_true(val):
+        if isinstance(val, bool):
+            return val
+        if isinstance(val, str):
+            return val.lower() == "true"
+        return False
+
+    return isinstance(data, dict) and (is_true(data.get("booking_confirmed")) or is_true(data.get("bookingconfirmed")))
+
+class BookingExtractor:
+    """
+    Splits an LLM reply into visible text and hidden JSON objects in one
+    linear pass, chunk by chunk, so it can run on streamed output.
+
+    A '{' opens a candidate object that is tracked with a brace depth that
+    ignores braces inside strings. If the first non-space character after it
+    isn't '"' or '}', it can't be JSON and is released as prose right away
+    (e.g. "{name}"). A balanced object is always withheld from the user, even
+    if it doesn't parse, so half-valid payloads don't leak; parsed dicts are
+    collected in 'payloads'. A code fence or "json" label right before the
+    object, and the closing fence after it, are withheld with it.
+
+    feed() returns the visible text that became final with this chunk; text
+    that might still turn out to be part of a payload is held back until
+    later chunks or finish() decide.
+    """
+    def __init__(self):
+        self.payloads = []
+        self.hidden = 0
+        self._visible = []
+        self._mode = _PROSE
+        self._held = ""
+        self._prelude = ""
+        self._fenced = False
+        self._object = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self) -> str:
+        """All visible text released so far."""
+        return "".join(self._visible)
+
+    @property
+    def booking(self):
+        """The first confirmed booking payload, or None."""
+        return next((data for data in self.payloads if is_booking_confirmed(data)), None)
+
+    def _release(self, text, released):
+        if text:
+            self._visible.append(text)
+            released.append(text)
+
+    def _close_object(self):
+        span = "".join(self._object)
+        self._object = []
+        self.hidden += 1
+        try:
+            self.payloads.append(json.loads(span))
+        except ValueError as e:
+            print(f"JSON Parsing Error: {e}")
+        self._fenced = "`" in self._prelude
+        self._prelude = ""
+        self._mode = _AFTER_OBJECT
+
+    def _scan_object(self, chunk, i):
+        """Consumes object characters from chunk[i:]; returns the index after the object or len(chunk)."""
+        start = i
+        while i < len(chunk):
+            char = chunk[i]
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._object.append(chunk[start:i])
+                    self._close_object()
+                    return i
+        self._object.append(chunk[start:])
+        return i
+
+    def feed(self, chunk: str) -> str:
+        released = []
+        i = 0
+        while i < len(chunk):
+            if self._mode == _PROSE:
+                brace = chunk.find("{", i)
+                if brace == -1:
+                    self._held += chunk[i:]
+                    break
+                self._held += chunk[i:brace]
+                tail = self._held[-_PRELUDE_WINDOW:]
+                prelude_len = len(tail) - _PRELUDE_RE.search(tail).start()
+                self._release(self._held[:len(self._held) - prelude_len], released)
+                self._prelude = self._held[len(self._held) - prelude_len:]
+                self._held = ""
+                self._object = ["{"]
+                self._depth = 1
+                self._in_string = self._escape = False
+                self._mode = _OBJECT_START
+                i = brace + 1
+
+            elif self._mode == _OBJECT_START:
+                while i < len(chunk) and chunk[i].isspace():
+                    self._object.append(chunk[i])
+                    i += 1
+                if i == len(chunk):
+                    break
+                if chunk[i] in '"}':
+                    self._mode = _OBJECT
+                else:
+                    # Not a JSON object: the brace and its label are prose
+                    self._release(self._prelude + "".join(self._object), released)
+                    self._prelude = ""
+                    self._object = []
+                    self._mode = _PROSE
+
+            elif self._mode == _OBJECT:
+                i = self._scan_object(chunk, i)
+
+            else:  # _AFTER_OBJECT
+                self._held += chunk[i:]
+                if self._fenced and _PARTIAL_FENCE_CLOSE_RE.fullmatch(self._held):
+                    return "".join(released)
+                rest = self._held
+                if self._fenced:
+                    rest = rest[_FENCE_CLOSE_RE.match(rest).end():] if _FENCE_CLOSE_RE.match(rest) else rest
+                self._held = ""
+                self._mode = _PROSE
+                chunk, i = rest, 0
+
+        if self._mode == _PROSE and self._held:
+            tail = self._held[-_PRELUDE_WINDOW:]
+            keep = len(tail) - _PARTIAL_PRELUDE_RE.search(tail).start()
+            self._release(self._held[:len(self._held) - keep], released)
+            self._held = self._held[len(self._held) - keep:]
+        return "".join(released)
+
+    def finish(self) -> str:
+        """Flushes held text at the end of the reply; returns the final visible part."""
+        released = []
+        if self._mode == _OBJECT_START:
+            self._release(self._prelude + "".join(self._object), released)
+        elif self._mode == _OBJECT:
+            # Unterminated payload (cut-off reply): keep it hidden
+            self.hidden += 1
+            print("JSON Parsing Error: unterminated object withheld")
+        elif self._mode == _AFTER_OBJECT and self._fenced and _PARTIAL_FENCE_CLOSE_RE.fullmatch(self._held):
+            self._held = ""
+        self._release(self._held, released)
+        self._held = ""
+        self._prelude = ""
+        self._object = []
+        self._mode = _PROSE
+        return "".join(released)
+
+def extract_booking(text: str) -> BookingExtractor:
+    """Runs a complete reply through a BookingExtractor."""
+    extractor = BookingExtractor()
+    extractor.feed(text)
+    extractor.finish()
+    return extractor
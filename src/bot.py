@@ -1,46 +1,201 @@
 import asyncio
 import os
+import signal
 import logging
 from dotenv import load_dotenv
 
 # Load env vars before importing modules that might use them at module level (like src.handlers -> src.llm)
 load_dotenv()
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
-from src.handlers import router
-from src.middleware import RateLimitMiddleware
-from src.database import init_db
+from src.handlers import router, history_store, coalescer, transcription_cache
+from src.middleware import RateLimitMiddleware, UpdateTracker, MetricsMiddleware, TracingMiddleware, TelegramMetricsMiddleware
+from src.config import BOT_CONFIG
+from src.database import init_db, close_db, watch_services
+from src.prompts import warm_prompt_cache
+from src.state import state_backend, BackendFSMStorage
+from src.metrics import start_metrics_server, ACTIVE_USERS, UPDATES_IN_PROGRESS, HISTORY_USERS, HISTORY_MESSAGES
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+class TrackedRequestHandler(SimpleRequestHandler):
+    """
+    Counts each update with the UpdateTracker when its request is accepted,
+    before the background task that handles it is spawned, so a shutdown
+    right after the 200 still waits for it.
+    """
+    def __init__(self, *args, update_tracker: UpdateTracker, **kwargs):
+        # Tells UpdateTracker not to count these updates a second time
+        super().__init__(*args, update_tracked=True, **kwargs)
+        self.update_tracker = update_tracker
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        self.update_tracker.begin()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        # A callback rather than a finally: it also runs if the task is cancelled before it starts
+        task.add_done_callback(lambda _: self.update_tracker.end())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+async def run_webhook(bot: Bot, dp: Dispatcher, update_tracker: UpdateTracker):
+    """
+    Serves updates pushed by Telegram on a built-in aiohttp server until SIGINT/SIGTERM.
+    Requests must carry WEBHOOK_SECRET in the X-Telegram-Bot-Api-Secret-Token header.
+    Updates can also be POSTed by hand (with the header) for local testing.
+    """
+    webhook_config = BOT_CONFIG.get("webhook", {})
+    host = webhook_config.get("host", "0.0.0.0")
+    port = webhook_config.get("port", 8080)
+    path = webhook_config.get("path", "/webhook")
+    base_url = webhook_config.get("base_url") or os.getenv("WEBHOOK_BASE_URL")
+    # main() refuses webhook mode without it: anyone could post forged updates
+    secret = os.getenv("WEBHOOK_SECRET")
+
+    app = web.Application()
+    TrackedRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, update_tracker=update_tracker).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook server listening on {host}:{port}{path}")
+
+    # Without a public URL (e.g. local testing) Telegram is not told about us
+    if base_url:
+        await bot.set_webhook(
+            url=base_url.rstrip("/") + path,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logging.info(f"Webhook registered at {base_url.rstrip('/')}{path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: KeyboardInterrupt still ends asyncio.run
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        # Stop accepting new updates, then let the accepted ones finish before
+        # the app shutdown closes the bot session
+        await site.stop()
+        if not await update_tracker.wait_idle(webhook_config.get("drain_timeout", 30)):
+            logging.warning(f"Shutting down with {update_tracker.active} updates still in progress")
+        await coalescer.wait_idle()
+        await runner.cleanup()
+
+def create_dispatcher():
+    """Builds the dispatcher with storage, middlewares and routers. Returns (dispatcher, update tracker)."""
+    # FSM state lives in the same backend as the rest of the runtime state
+    dp = Dispatcher(storage=BackendFSMStorage(state_backend))
+
+    # Register Middleware
+    update_tracker = UpdateTracker()
+    dp.update.outer_middleware(update_tracker)
+    metrics_middleware = MetricsMiddleware()
+    dp.update.outer_middleware(metrics_middleware)
+    # Innermost outer middleware: the trace covers exactly the update's handling
+    dp.update.outer_middleware(TracingMiddleware())
+    # Separate budgets for text, voice and callbacks (see rate_limit in bot_config.yaml)
+    rate_limiter = RateLimitMiddleware()
+    dp.message.middleware(rate_limiter)
+    dp.callback_query.middleware(rate_limiter)
+
+    # Register Routers
+    dp.include_router(router)
+
+    # Gauges are read at scrape time
+    ACTIVE_USERS.set_function(metrics_middleware.active_users)
+    UPDATES_IN_PROGRESS.set_function(lambda: update_tracker.active)
+    HISTORY_USERS.set_function(lambda: len(history_store))
+    HISTORY_MESSAGES.set_function(history_store.message_count)
+    return dp, update_tracker
+
 async def main():
     # Initialize DB (if running locally or ensure it's hit at startup)
     try:
-        init_db()
+        await init_db()
     except Exception as e:
         logging.error(f"DB Init failed (might be expected if mongo container not ready yet): {e}")
 
+    # Shared state (TTL indexes for the Mongo backend)
+    try:
+        await state_backend.setup()
+    except Exception as e:
+        logging.error(f"State backend setup failed: {e}")
+
+    try:
+        await transcription_cache.setup()
+    except Exception as e:
+        logging.error(f"Transcription cache setup failed: {e}")
+
+    # Compile every persona prompt up front so LLM calls only render services_context
+    logging.info(f"Precompiled {warm_prompt_cache()} persona prompts.")
+
     bot_token = os.getenv("BOT_TOKEN")
     if not bot_token or bot_token == "YOUR_TELEGRAM_BOT_TOKEN":
         logging.error("BOT_TOKEN is not set in .env")
+        await close_db()
+        return
+
+    webhook_enabled = BOT_CONFIG.get("webhook", {}).get("enabled", False)
+    if webhook_enabled and not os.getenv("WEBHOOK_SECRET"):
+        logging.error("WEBHOOK_SECRET is not set in .env; it is required in webhook mode")
+        await close_db()
         return
 
     bot = Bot(token=bot_token)
-    dp = Dispatcher()
+    # Time every Bot API call
+    bot.session.middleware(TelegramMetricsMiddleware())
+    dp, update_tracker = create_dispatcher()
 
-    # Register Middleware
-    dp.message.middleware(RateLimitMiddleware(limit=2, window=3)) # 2 msgs per 3 secs
+    # Refresh the cached price list as soon as the services collection changes
+    watcher = None
+    if BOT_CONFIG.get("services_cache", {}).get("watch", True):
+        watcher = asyncio.create_task(watch_services())
 
-    # Register Routers
-    dp.include_router(router)
+    # Write-behind flushing of conversation histories
+    history_store.start()
+
+    metrics_runner = None
+    try:
+        metrics_runner = await start_metrics_server()
+    except Exception as e:
+        logging.error(f"Metrics server failed to start: {e}")
 
-    logging.info("Starting bot...")
     try:
-        await dp.start_polling(bot)
+        if webhook_enabled:
+            logging.info("Starting bot (webhook)...")
+            await run_webhook(bot, dp, update_tracker)
+        else:
+            logging.info("Starting bot...")
+            # Webhook and long polling are exclusive on Telegram's side
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
-        logging.error(f"Polling error: {e}")
+        logging.error(f"Update loop error: {e}")
+    finally:
+        if watcher:
+            watcher.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        # Let queued turns finish before the final history flush
+        await coalescer.wait_idle()
+        await history_store.stop()
+        await state_backend.close()
+        await close_db()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from src.config import BOT_CONFIG
+from src.tracing import trace
+
+# State of the turn being processed by the current task, if it came through the coalescer
+_current_turn = ContextVar("current_turn", default=None)
+
+def mark_turn_committed():
+    """
+    Called by the turn handler right before it produces visible output or
+    writes history. After this point new input no longer cancels the turn;
+    it waits for it to finish instead.
+    """
+    state = _current_turn.get()
+    if state is not None:
+        state.committed = True
+
+class _UserState:
+    def __init__(self):
+        self.texts = []
+        self.message = None
+        self.is_voice_input = False
+        self.timer = None
+        self.running = None
+        self.committed = False
+        self.lock = asyncio.Lock()
+
+class MessageCoalescer:
+    """
+    Merges bursts of messages from one user into a single LLM turn.
+    Every new input restarts a short debounce window; when it elapses the
+    queued texts are joined and passed to handler(message, text, is_voice_input).
+    New input also supersedes a turn that has not committed any output yet:
+    the turn is cancelled and its texts are merged into the next one.
+    Turns of the same user never overlap.
+    """
+    def __init__(self, handler, window: float = None, supersede: bool = None, enabled: bool = None):
+        coalescing_config = BOT_CONFIG.get("coalescing", {})
+        self.handler = handler
+        self.enabled = enabled if enabled is not None else coalescing_config.get("enabled", True)
+        self.window = window if window is not None else coalescing_config.get("window", 1.0)
+        self.supersede = supersede if supersede is not None else coalescing_config.get("supersede", True)
+
+        self._users = {}
+        self._tasks = set()
+
+    async def submit(self, message, text, is_voice_input: bool = False):
+        """Queues input for the user's next turn and returns without waiting for it."""
+        if not self.enabled:
+            await self.handler(message, text, is_voice_input)
+            return
+
+        user_id = message.from_user.id
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState()
+
+        state.texts.append(text)
+        state.message = message
+        state.is_voice_input = state.is_voice_input or is_voice_input
+
+        if state.timer:
+            state.timer.cancel()
+        if self.supersede and state.running and not state.committed:
+            state.running.cancel()
+
+        state.timer = asyncio.create_task(self._fire(user_id, state))
+        self._tasks.add(state.timer)
+        state.timer.add_done_callback(self._tasks.discard)
+
+    async def _fire(self, user_id, state):
+        await asyncio.sleep(self.window)
+        # Past the debounce window: from here on only supersede may cancel us
+        state.timer = None
+
+        async with state.lock:
+            if not state.texts:
+                return
+            texts, message, is_voice_input = state.texts, state.message, state.is_voice_input
+            state.texts, state.is_voice_input = [], False
+            state.committed = False
+            state.running = asyncio.current_task()
+            _current_turn.set(state)
+
+            try:
+                # Runs after the triggering update returned: traced as a turn of its own
+                with trace("turn", user_id=user_id, messages=len(texts)):
+                    await self.handler(message, "\n".join(t for t in texts if t), is_voice_input)
+            except asyncio.CancelledError:
+                if state.committed:
+                    raise
+                # Superseded: give the texts back so the next turn includes them
+                state.texts[:0] = texts
+                state.is_voice_input = state.is_voice_input or is_voice_input
+            except Exception:
+                logging.exception(f"Failed to process turn for user {user_id}")
+            finally:
+                state.running = None
+
+        if not state.texts and state.timer is None and not state.lock.locked():
+            self._users.pop(user_id, None)
+
+    async def wait_idle(self):
+        """Waits for all pending and running turns to finish."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
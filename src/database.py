@@ -1,90 +1,203 @@
 import os
-from pymongo import MongoClient
+import time
+import asyncio
+from pymongo import AsyncMongoClient
+from pymongo.errors import OperationFailure
+from src.config import BOT_CONFIG
+from src.metrics import timer, STAGE_SECONDS
 
 # Use 'localhost' if running outside docker (for testing scripts), or 'mongo' service name inside docker
 # But for the app running inside docker, it will use the env var which defaults to 'mongodb://mongo:27017/portfolio_bot'
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/portfolio_bot")
 
+# One pooled async client per process, created lazily on first use.
+_client = None
+
+def get_client():
+    """Returns the shared AsyncMongoClient, creating it on first call."""
+    global _client
+    if _client is None:
+        db_config = BOT_CONFIG.get("database", {})
+        _client = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=db_config.get("max_pool_size", 50),
+            minPoolSize=db_config.get("min_pool_size", 0),
+            maxIdleTimeMS=db_config.get("max_idle_time_ms", 60000),
+            serverSelectionTimeoutMS=db_config.get("server_selection_timeout_ms", 5000),
+            connectTimeoutMS=db_config.get("connect_timeout_ms", 5000),
+            socketTimeoutMS=db_config.get("socket_timeout_ms", 10000),
+        )
+    return _client
+
 def get_db():
-    client = MongoClient(MONGO_URI)
-    return client.get_database()
+    return get_client().get_database()
+
+async def close_db():
+    """Closes the shared client. Called once on shutdown from src/bot.py."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
-def init_db():
+# Seed data for the services collection. Also used to build the price list
+# locally when the database is unreachable.
+DEFAULT_SERVICES = [
+    {
+        "name": "Простые боты (автоответчики, скрипты)",
+        "price_range": "от 1 500 руб.",
+        "description": "Базовая автоматизация, ответы на вопросы, меню. Идеально для старта."
+    },
+    {
+        "name": "AI-Ассистенты",
+        "price_range": "6 000 - 10 000 руб. (в среднем)",
+        "description": "Умные боты с LLM (как этот). Гибкие ответы, интеграция с AI."
+    },
+    {
+        "name": "Web Apps / Сложные интеграции",
+        "price_range": "Индивидуально",
+        "description": "Полноценные приложения внутри Telegram, работа с базами данных и API."
+    },
+    {
+        "name": "Техническая поддержка",
+        "price_range": "Обсуждается отдельно",
+        "description": "Поддержка, доработка и улучшение функционала после сдачи проекта."
+    }
+]
+
+async def init_db():
     db = get_db()
     services_collection = db["services"]
 
     # Check if we already have services, if not, seed them
     # Note: To update services, we might need to drop collection or update logic.
     # For now, we will clear and re-insert to reflect the new pricing policy.
-    services_collection.delete_many({}) # Reset services to update to new pricing
-
-    initial_services = [
-        {
-            "name": "Простые боты (автоответчики, скрипты)",
-            "price_range": "от 1 500 руб.",
-            "description": "Базовая автоматизация, ответы на вопросы, меню. Идеально для старта."
-        },
-        {
-            "name": "AI-Ассистенты",
-            "price_range": "6 000 - 10 000 руб. (в среднем)",
-            "description": "Умные боты с LLM (как этот). Гибкие ответы, интеграция с AI."
-        },
-        {
-            "name": "Web Apps / Сложные интеграции",
-            "price_range": "Индивидуально",
-            "description": "Полноценные приложения внутри Telegram, работа с базами данных и API."
-        },
-        {
-            "name": "Техническая поддержка",
-            "price_range": "Обсуждается отдельно",
-            "description": "Поддержка, доработка и улучшение функционала после сдачи проекта."
-        }
-    ]
-    services_collection.insert_many(initial_services)
-    print("Database initialized with updated services.")
+    await services_collection.delete_many({}) # Reset services to update to new pricing
 
-def get_services_context():
-    """Fetches services and returns a string formatted for the LLM system prompt."""
-    db = get_db()
-    services = db["services"].find()
+    # insert_many mutates the dicts (adds _id), so insert copies
+    await services_collection.insert_many([dict(s) for s in DEFAULT_SERVICES])
+    invalidate_services_context()
 
-    text = "Информация о ценах и услугах:\n"
-    text += "Мы предлагаем разработку Telegram-ботов по ценам в среднем в 2 раза ниже рыночных.\n\n"
+    # Lookups by user_id happen on every message
+    await db["users"].create_index("user_id")
+    await db["histories"].create_index("user_id", unique=True)
+    print("Database initialized with updated services.")
 
-    text += "**Прайс-лист (ориентировочный):**\n"
+def build_services_context(services):
+    """Formats a list of service documents as the text block for the LLM system prompt."""
+    lines = [
+        "Информация о ценах и услугах:",
+        "Мы предлагаем разработку Telegram-ботов по ценам в среднем в 2 раза ниже рыночных.",
+        "",
+        "**Прайс-лист (ориентировочный):**",
+    ]
     for s in services:
-        text += f"- {s['name']}: {s['price_range']}. {s['description']}\n"
+        lines.append(f"- {s['name']}: {s['price_range']}. {s['description']}")
 
-    text += "\n**Важно знать:**\n"
-    text += "- **Индивидуальный подход:** Чем интереснее задача, тем гибче цена. Цены ориентировочные и зависят от ваших 'хотелок'.\n"
-    text += "- **Хостинг и Ключи:** Мы не продаем хостинг и ключи, но **бесплатно** поможем найти самые выгодные (или бесплатные) варианты и настроить работу 24/7.\n"
-    text += "- **Связь:** По сложным вопросам бот перенаправит вас к разработчику (@Lotargo).\n"
+    lines += [
+        "",
+        "**Важно знать:**",
+        "- **Индивидуальный подход:** Чем интереснее задача, тем гибче цена. Цены ориентировочные и зависят от ваших 'хотелок'.",
+        "- **Хостинг и Ключи:** Мы не продаем хостинг и ключи, но **бесплатно** поможем найти самые выгодные (или бесплатные) варианты и настроить работу 24/7.",
+        "- **Связь:** По сложным вопросам бот перенаправит вас к разработчику (@Lotargo).",
+    ]
+    return "\n".join(lines) + "\n"
 
-    return text
+# --- Services Context Cache ---
+# The catalog changes rarely, so the rendered text is kept in memory and
+# rebuilt only when the TTL expires, an admin reloads it, or the change
+# stream reports a write to the services collection.
+_services_cache = {"text": None, "expires_at": 0.0, "version": 0}
+_services_lock = asyncio.Lock()
+
+def invalidate_services_context():
+    """Marks the cached services text as stale; the next read reloads it."""
+    _services_cache["expires_at"] = 0.0
+
+def get_services_version():
+    """Returns a counter that changes whenever the services text changes."""
+    return _services_cache["version"]
+
+def _store_services_context(text, ttl):
+    if text != _services_cache["text"]:
+        _services_cache["text"] = text
+        _services_cache["version"] += 1
+    _services_cache["expires_at"] = time.monotonic() + ttl
+
+async def get_services_context():
+    """Returns the services block for the LLM system prompt, served from memory."""
+    if _services_cache["text"] is not None and time.monotonic() < _services_cache["expires_at"]:
+        return _services_cache["text"]
+
+    cache_config = BOT_CONFIG.get("services_cache", {})
+    async with _services_lock:
+        # Another task may have refreshed it while we were waiting
+        if _services_cache["text"] is not None and time.monotonic() < _services_cache["expires_at"]:
+            return _services_cache["text"]
+
+        try:
+            with timer(STAGE_SECONDS, stage="mongo_services"):
+                services = await get_db()["services"].find().to_list()
+            _store_services_context(build_services_context(services), cache_config.get("ttl", 3600))
+        except Exception as e:
+            print(f"Error fetching services context: {e}")
+            # Keep serving the last good text; only fall back to the built-in
+            # price list if we have never loaded one. Retry again soon.
+            retry = cache_config.get("retry_interval", 30)
+            if _services_cache["text"] is None:
+                _store_services_context(build_services_context(DEFAULT_SERVICES), retry)
+            else:
+                _services_cache["expires_at"] = time.monotonic() + retry
+
+        return _services_cache["text"]
+
+async def watch_services():
+    """
+    Invalidates the services cache on every change to the collection.
+    Change streams need a replica set; on a standalone server this logs once
+    and returns, leaving the TTL as the only refresh trigger.
+    """
+    while True:
+        try:
+            async with await get_db()["services"].watch() as stream:
+                async for _ in stream:
+                    invalidate_services_context()
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as e:
+            print(f"Services change stream unavailable, relying on TTL: {e}")
+            return
+        except Exception as e:
+            print(f"Services change stream error: {e}")
+            await asyncio.sleep(BOT_CONFIG.get("services_cache", {}).get("retry_interval", 30))
 
 # --- User Management ---
 
-def save_user(user_id, data):
+async def save_user(user_id, data):
     """Saves or updates user data in the 'users' collection."""
     db = get_db()
-    db["users"].update_one(
+    await db["users"].update_one(
         {"user_id": user_id},
         {"$set": data},
         upsert=True
     )
 
-def get_user(user_id):
+async def get_user(user_id):
     """Retrieves user data by user_id. Returns None if not found."""
     db = get_db()
-    return db["users"].find_one({"user_id": user_id})
+    with timer(STAGE_SECONDS, stage="mongo_get_user"):
+        return await db["users"].find_one({"user_id": user_id})
 
-def delete_user(user_id):
+async def delete_user(user_id):
     """Deletes a user from the 'users' collection."""
     db = get_db()
-    result = db["users"].delete_one({"user_id": user_id})
+    result = await db["users"].delete_one({"user_id": user_id})
     return result.deleted_count > 0
 
 if __name__ == "__main__":
     # Allow running this file directly to seed DB locally
-    init_db()
-    print(get_services_context())
+    async def main():
+        await init_db()
+        print(await get_services_context())
+        await close_db()
+
+    asyncio.run(main())
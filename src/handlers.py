@@ -1,25 +1,50 @@
 import os
-import json
-import re
+import time
 import asyncio
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BufferedInputFile
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramRetryAfter
-from src.llm import LLMClient
-from src.database import get_services_context, save_user, get_user, delete_user
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from src.llm import LLMClient, StreamInterrupted, FALLBACK_RESPONSE
+from src.answer_cache import AnswerCache
+from src.transcription_cache import TranscriptionCache
+from src.config import LLM_CONFIG
+from src.database import save_user, get_user, delete_user, invalidate_services_context, get_services_context
 from src.prompts import set_mode, list_modes, get_current_mode, _get_or_create_user_persona
 from src.audio import AudioClient
+from src.text import sanitize_reply, strip_markdown
+from src.booking import BookingExtractor, extract_booking
+from src.metrics import timer, STAGE_SECONDS
+from src.tracing import profiler
+from src.transcode import transcode_pool
+from src.history import HistoryStore
+from src.coalescer import MessageCoalescer, mark_turn_committed
+from src.scheduler import LLMScheduler, SchedulerBusy, PRIORITY_BOOKING, PRIORITY_CHAT
 
 router = Router()
 llm_client = LLMClient()
 audio_client = AudioClient()
 
-# In-memory history for MVP: {user_id: [{"role": "...", "content": "..."}]}
-user_histories = {}
-MAX_HISTORY = 25
+# Conversation history: LRU hot tier in memory, persisted to Mongo
+history_store = HistoryStore()
+
+# Caps concurrent LLM calls, one per user, booking flows first
+llm_scheduler = LLMScheduler()
+
+# Answers to common opening questions, per persona
+answer_cache = AnswerCache()
+
+# Transcripts of voice notes already seen (forwards, re-sends)
+transcription_cache = TranscriptionCache()
+
+# Streamed replies are sent as soon as text appears and then edited in place
+STREAMING_CONFIG = LLM_CONFIG.get("streaming", {})
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Appended to a cut-off streamed reply in history so the LLM knows it was not finished
+INTERRUPTED_NOTE = "\n[System: this reply was interrupted by a connection error and is incomplete]"
 
 class FeedbackState(StatesGroup):
     waiting_for_message = State()
@@ -34,19 +59,10 @@ def get_main_keyboard():
         resize_keyboard=True
     )
 
-def strip_markdown(text):
-    """
-    Removes Markdown syntax characters to prevent rendering issues.
-    Removes: *, _, `, [, ]
-    """
-    # Simple regex to remove common markdown chars
-    # We want to keep text, just remove the formatting symbols
-    return re.sub(r"[\*\_`\[\]]", "", text)
-
 @router.message(CommandStart())
 async def cmd_start(message: Message):
     user_id = message.from_user.id
-    user_histories[user_id] = []
+    await history_store.clear(user_id)
 
     welcome_text = (
         "Привет! Я виртуальный секретарь разработчика.\n"
@@ -71,13 +87,13 @@ async def cmd_help(message: Message):
 @router.message(Command("clear"))
 async def cmd_clear(message: Message):
     user_id = message.from_user.id
-    user_histories[user_id] = []
+    await history_store.clear(user_id)
     await message.answer("🧹 История диалога очищена.")
 
 @router.message(Command("profile"))
 async def cmd_profile(message: Message):
     user_id = message.from_user.id
-    user_data = get_user(user_id)
+    user_data = await get_user(user_id)
 
     if not user_data:
         await message.answer("❌ У меня нет ваших сохраненных данных.")
@@ -98,7 +114,7 @@ async def cmd_profile(message: Message):
 @router.callback_query(F.data == "delete_my_data")
 async def handle_delete_data(callback: CallbackQuery):
     user_id = callback.from_user.id
-    if delete_user(user_id):
+    if await delete_user(user_id):
         await callback.message.edit_text("✅ Ваши данные были успешно удалены из базы.")
     else:
         await callback.message.edit_text("❌ Ошибка удаления или данные не найдены.")
@@ -114,13 +130,16 @@ async def cmd_admin(message: Message):
         "🛠 **Панель администратора:**\n\n"
         "/set_mode <mode> - Сменить режим бота\n"
         "/modes - Список доступных режимов\n"
+        "/reload_services - Обновить прайс-лист из базы\n"
+        "/stats - Нагрузка, очередь LLM и кэши\n"
+        "/profiling <N> - Профилировать следующие N обновлений (/profiling stop - остановить)\n"
         "/set_admin - Узнать ID чата для конфига"
     )
 
 @router.message(Command("modes"))
 async def cmd_modes(message: Message):
     modes = list_modes()
-    current = get_current_mode()
+    current = await get_current_mode()
     text = f"Текущий режим: **{current}**\n\nДоступные режимы:\n" + "\n".join([f"- {m}" for m in modes])
     await message.answer(text, parse_mode="Markdown")
 
@@ -137,11 +156,112 @@ async def cmd_set_mode(message: Message):
         return
 
     mode_name = args[1]
-    if set_mode(mode_name):
+    if await set_mode(mode_name):
         await message.answer(f"✅ Режим бота изменен на: **{mode_name}**", parse_mode="Markdown")
     else:
         await message.answer(f"❌ Режим `{mode_name}` не найден. Проверьте папку config/prompts.", parse_mode="Markdown")
 
+@router.message(Command("reload_services"))
+async def cmd_reload_services(message: Message):
+    admin_group_id = os.getenv("ADMIN_GROUP_ID")
+    if str(message.chat.id) != str(admin_group_id):
+        await message.answer("🔒 Эта команда доступна только администратору.")
+        return
+
+    invalidate_services_context()
+    await get_services_context()
+    await message.answer("✅ Прайс-лист обновлен.")
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    admin_group_id = os.getenv("ADMIN_GROUP_ID")
+    if str(message.chat.id) != str(admin_group_id):
+        await message.answer("🔒 Эта команда доступна только администратору.")
+        return
+
+    stats = llm_scheduler.stats()
+    lines = [
+        "📊 LLM очередь:",
+        f"В работе: {stats['in_flight']}, в очереди: {stats['queued']}, отклонено: {stats['rejected']}",
+    ]
+    for lane, lane_stats in stats["lanes"].items():
+        lines.append(
+            f"- {lane}: в очереди {lane_stats['queued']}, обслужено {lane_stats['served']}, "
+            f"ожидание ср. {lane_stats['avg_wait']:.2f}с / макс. {lane_stats['max_wait']:.2f}с"
+        )
+
+    cache_stats = answer_cache.stats()
+    lines.append(
+        f"\n💾 Кэш ответов: {cache_stats['entries']} записей, "
+        f"попаданий {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']} ({cache_stats['hit_rate']:.0%})"
+    )
+
+    audio_stats = transcode_pool.stats()
+    lines.append(f"\n🎧 Аудио-конвертация: в работе {audio_stats['running']}, в очереди {audio_stats['waiting']}")
+    for label, job_stats in audio_stats["jobs"].items():
+        lines.append(
+            f"- {label}: {job_stats['jobs']} ок, {job_stats['failed']} ошибок, {job_stats['timeouts']} таймаутов, "
+            f"{job_stats['rejected']} отклонено; ожидание ср. {job_stats['avg_wait']:.2f}с, "
+            f"конвертация ср. {job_stats['avg_run']:.2f}с / макс. {job_stats['max_run']:.2f}с"
+        )
+
+    tts_stats = audio_client.tts_cache.stats()
+    lines.append(
+        f"\n🔊 Кэш озвучки: {tts_stats['entries']} записей ({tts_stats['bytes'] // 1024} КБ), "
+        f"попаданий {tts_stats['hits']} + по file_id {tts_stats['file_id_hits']}, промахов {tts_stats['misses']} "
+        f"({tts_stats['hit_rate']:.0%})"
+    )
+
+    stt_stats = audio_client.stt_stats
+    lines.append(
+        f"\n🎙 Распознавание: {stt_stats['requests']} запросов, "
+        f"{stt_stats['bytes_in'] // 1024} КБ получено → {stt_stats['bytes_uploaded'] // 1024} КБ отправлено, "
+        f"обрезано тишины {stt_stats['seconds_removed']:.1f}с из {stt_stats['seconds_total']:.1f}с; "
+        f"частей {stt_stats['chunks']}, из них с ошибкой {stt_stats['chunk_failures']}"
+    )
+
+    transcript_stats = transcription_cache.stats()
+    lines.append(
+        f"📝 Кэш расшифровок: {transcript_stats['entries']} записей, "
+        f"попаданий {transcript_stats['hits']} (из них из БД {transcript_stats['db_hits']}), "
+        f"промахов {transcript_stats['misses']} ({transcript_stats['hit_rate']:.0%})"
+    )
+    await message.answer("\n".join(lines))
+
+@router.message(Command("profiling"))
+async def cmd_profiling(message: Message):
+    admin_group_id = os.getenv("ADMIN_GROUP_ID")
+    if str(message.chat.id) != str(admin_group_id):
+        await message.answer("🔒 Эта команда доступна только администратору.")
+        return
+
+    args = message.text.split()
+    if len(args) > 1 and args[1] == "stop":
+        if not profiler.active:
+            await message.answer("Профилирование не запущено.")
+            return
+        await message.answer(profiler.stop())
+        return
+
+    if len(args) < 2 or not args[1].isdigit() or int(args[1]) < 1:
+        status = f"идёт, осталось {profiler.remaining} обновлений" if profiler.active else "выключено"
+        await message.answer(f"Использование: /profiling <N> | /profiling stop\nСейчас: {status}")
+        return
+
+    if profiler.active:
+        await message.answer(
+            f"Профилирование уже идёт, осталось {profiler.remaining} обновлений. "
+            f"Получить отчёт сейчас: /profiling stop"
+        )
+        return
+
+    try:
+        profiler.start(int(args[1]), message.chat.id)
+    except ValueError as e:
+        await message.answer(f"❌ Не удалось запустить профилировщик: {e}")
+        return
+    await message.answer(f"🔬 Профилирую следующие {args[1]} обновлений, отчёт придёт сюда.")
+
 @router.message(F.text == "ℹ️ О нас")
 async def handle_about(message: Message):
     about_text = (
@@ -156,24 +276,25 @@ async def handle_about(message: Message):
 async def handle_voice(message: Message, bot: Bot):
     await bot.send_chat_action(chat_id=message.chat.id, action="typing")
 
-    file_id = message.voice.file_id
-    file = await bot.get_file(file_id)
-    file_path = file.file_path
+    # Forwarded or re-sent voice notes keep their file_unique_id: skip download and STT
+    unique_id = message.voice.file_unique_id
+    text = await transcription_cache.get(unique_id)
 
-    # Download file locally
-    local_filename = f"voice_{file_id}.oga"
-    await bot.download_file(file_path, local_filename)
+    if text is None:
+        file = await bot.get_file(message.voice.file_id)
 
-    # Transcribe
-    text = await audio_client.transcribe(local_filename)
+        # Download into memory, no temp files
+        voice_buffer = await bot.download_file(file.file_path)
 
-    # Cleanup
-    if os.path.exists(local_filename):
-        os.remove(local_filename)
+        # Transcribe
+        text, complete = await audio_client.transcribe(voice_buffer.getvalue())
+        # A transcript with failed chunks would be replayed for the whole TTL instead of retried
+        if complete:
+            await transcription_cache.put(unique_id, text)
 
     if text:
         # Treat as text message, explicitly flagging as voice input
-        await process_user_text(message, text, is_voice_input=True)
+        await coalescer.submit(message, text, is_voice_input=True)
     else:
         await message.answer("😔 Не удалось распознать голосовое сообщение.")
 
@@ -240,17 +361,13 @@ async def handle_contact(message: Message):
         "name": f"{contact.first_name} {contact.last_name or ''}".strip(),
         "phone": contact.phone_number
     }
-    save_user(user_id, user_data)
-
-    # Initialize history if new
-    if user_id not in user_histories:
-        user_histories[user_id] = []
+    await save_user(user_id, user_data)
 
     # Inject contact info into the conversation history
     contact_info = f"Name={user_data['name']}, Phone={user_data['phone']}"
 
     # Add a system note posing as a user action
-    user_histories[user_id].append({
+    await history_store.append(user_id, {
         "role": "user",
         "content": f"[System: User shared verified contact card]\n{contact_info}\n(Action: Acknowledge receipt and continue conversation)"
     })
@@ -258,7 +375,8 @@ async def handle_contact(message: Message):
     # Trigger LLM response immediately instead of static message
     await message.answer("✅ Контакт сохранен.", reply_markup=get_main_keyboard())
 
-    await process_user_text(message, user_text="", skip_user_history=True)
+    # Goes through the coalescer so it can't overlap another turn of this user
+    await coalescer.submit(message, "")
 
 @router.message(Command("set_admin"))
 async def cmd_set_admin(message: Message):
@@ -271,27 +389,129 @@ async def cmd_set_admin(message: Message):
         f"Затем перезапустите бота."
     )
 
+async def edit_message_text(sent_message: Message, text: str) -> bool:
+    """
+    Edits a bot message, waiting out one flood-control pause if needed.
+    Never raises: the reply already exists, so a failed edit must not lose
+    the turn. Text past Telegram's limit is cut off. Returns False on failure.
+    """
+    text = text[:TELEGRAM_MESSAGE_LIMIT]
+    for attempt in range(2):
+        try:
+            await sent_message.edit_text(text)
+            return True
+        except TelegramRetryAfter as e:
+            if attempt:
+                print(f"Failed to edit message: flood control again ({e.retry_after}s)")
+                return False
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            # The message already shows this text
+            if "message is not modified" in str(e):
+                return True
+            print(f"Failed to edit message: {e}")
+            return False
+        except Exception as e:
+            print(f"Failed to edit message: {e}")
+            return False
+    return False
+
+async def send_voice_reply(message: Message, voice_reply):
+    """
+    Sends a synthesized reply as a voice message: by file_id when Telegram
+    already has the audio, otherwise (or if the id is rejected) by uploading
+    the Opus bytes and remembering the new file_id.
+    """
+    if voice_reply.file_id:
+        try:
+            await message.reply_voice(voice_reply.file_id)
+            return
+        except Exception as e:
+            print(f"Failed to send voice message by file_id, uploading instead: {e}")
+            await audio_client.forget_file_id(voice_reply.key)
+
+    data = voice_reply.data or await audio_client.cached_voice(voice_reply.key)
+    if not data:
+        print("Failed to send voice message: audio is no longer cached")
+        return
+    try:
+        sent = await message.reply_voice(BufferedInputFile(data, filename="reply.ogg"))
+        if sent.voice:
+            await audio_client.remember_file_id(voice_reply.key, sent.voice.file_id)
+    except Exception as e:
+        print(f"Failed to send voice message: {e}")
+
+async def stream_llm_reply(message: Message, history_for_llm: list, user_id: int):
+    """
+    Streams the LLM response into a single Telegram message.
+    The message is sent as soon as there is visible text and then edited at
+    most once per edit_interval seconds; a booking JSON block is withheld by
+    the extractor as it arrives. Returns (full response text, extractor,
+    sent message or None, text currently shown, whether the stream finished).
+    """
+    edit_interval = STREAMING_CONFIG.get("edit_interval", 1.0)
+    extractor = BookingExtractor()
+    extract_seconds = 0.0
+    chunks = []
+    sent_message = None
+    shown = ""
+    next_edit_at = 0.0
+    complete = True
+
+    try:
+        async for chunk in llm_client.stream_response(history_for_llm, user_id=user_id):
+            chunks.append(chunk)
+            started_at = time.perf_counter()
+            extractor.feed(chunk)
+            extract_seconds += time.perf_counter() - started_at
+            now = time.monotonic()
+            if now < next_edit_at:
+                continue
+
+            visible = strip_markdown(extractor.text).strip()[:TELEGRAM_MESSAGE_LIMIT]
+            if not visible or visible == shown:
+                continue
+
+            try:
+                if sent_message is None:
+                    # Once the user sees text, new input must not cancel this turn
+                    mark_turn_committed()
+                    sent_message = await message.answer(visible)
+                else:
+                    await sent_message.edit_text(visible)
+                shown = visible
+                next_edit_at = now + edit_interval
+            except TelegramRetryAfter as e:
+                next_edit_at = now + e.retry_after
+            except Exception as e:
+                # Bad request, network error: keep streaming, the final edit catches up
+                print(f"Failed to update streamed message: {e}")
+                next_edit_at = now + edit_interval
+    except StreamInterrupted as e:
+        # Keep what the user already sees; the caller must not treat it as a full answer
+        print(f"LLM stream interrupted: {e}")
+        complete = False
+
+    extractor.finish()
+    STAGE_SECONDS.labels(stage="booking_extract").observe(extract_seconds)
+    return "".join(chunks), extractor, sent_message, shown, complete
+
 async def process_user_text(message: Message, user_text: str, is_voice_input: bool = False, skip_user_history: bool = False):
     user_id = message.from_user.id
 
-    # Initialize history if new
-    if user_id not in user_histories:
-        user_histories[user_id] = []
-
-    # Update history unless skipped (e.g. for contact event already added)
+    # The user turn is stored together with the reply once it is committed, so a
+    # superseded turn leaves no trace (skipped e.g. for contact event already added)
+    user_turn = []
     if not skip_user_history and user_text:
-        user_histories[user_id].append({"role": "user", "content": user_text})
-
-    # Keep only last N messages to save context/tokens
-    if len(user_histories[user_id]) > MAX_HISTORY:
-        user_histories[user_id] = user_histories[user_id][-MAX_HISTORY:]
+        user_turn.append({"role": "user", "content": user_text})
 
     # Show typing status
     await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
 
     # Inject persistent contact info into LLM context if available
-    history_for_llm = list(user_histories[user_id])
-    user_data = get_user(user_id)
+    stored_history = await history_store.get(user_id)
+    history_for_llm = stored_history + user_turn
+    user_data = await get_user(user_id)
     if user_data:
         contact_note = (
             f"[System Note: Verified contact details:\n"
@@ -301,64 +521,61 @@ async def process_user_text(message: Message, user_text: str, is_voice_input: bo
         )
         history_for_llm.insert(0, {"role": "system", "content": contact_note})
 
-    # Get LLM response (NON-STREAMING REVERTED)
-    response_text = await llm_client.generate_response(history_for_llm, user_id=user_id)
+    # Users who already shared a contact are in the booking flow and go first
+    priority = PRIORITY_BOOKING if user_data else PRIORITY_CHAT
 
-    # Post-processing (JSON parsing, Clean, TTS, History Update)
+    # Opening questions may already have an answer for this persona
+    persona = await _get_or_create_user_persona(user_id)
+    response_text = answer_cache.get(user_text, persona, stored_history, user_data)
 
-    # Store original response for history (LLM memory should include what it generated, including JSON)
-    # However, if we strip JSON from user view, LLM context has it, which is correct (LLM knows it confirmed).
-    user_histories[user_id].append({"role": "assistant", "content": response_text})
-
-    # Try to parse JSON from the response
-    booking_data = None
-
-    # Check if a JSON block exists in the response
-    # Regex captures { ... } block across lines
-    json_match = re.search(r"\{.*\}", response_text, re.DOTALL)
-
-    if json_match:
-        json_str = json_match.group(0)
+    # Get LLM response. Text replies are streamed; voice replies need the full text for TTS.
+    extractor = None
+    streamed_message = None
+    streamed_text = ""
+    response_complete = True
+    if response_text is None:
         try:
-            data = json.loads(json_str)
-            # Check for booking confirmation key (handle both snake_case and merged just in case)
-            # Strict Boolean Check: value must be True (bool) or "true" (string case-insensitive)
-            # We explicitly reject False/"false".
-            is_confirmed = False
-
-            # Helper to check if value is 'true-ish'
-            def is_true(val):
-                if isinstance(val, bool):
-                    return val
-                if isinstance(val, str):
-                    return val.lower() == "true"
-                return False
-
-            if is_true(data.get("booking_confirmed")) or is_true(data.get("bookingconfirmed")):
-                is_confirmed = True
-
-            if is_confirmed:
-                booking_data = data
-        except Exception as e:
-            print(f"JSON Parsing Error: {e}")
-
-        # ALWAYS remove the JSON block from the user-facing text if found,
-        # regardless of whether it's a valid booking or not, to prevent leakage.
-
-        # 1. Remove the JSON string itself
-        clean_text = response_text.replace(json_str, "")
+            async with llm_scheduler.slot(user_id, priority):
+                if STREAMING_CONFIG.get("enabled", False) and not is_voice_input:
+                    (response_text, extractor, streamed_message,
+                     streamed_text, response_complete) = await stream_llm_reply(message, history_for_llm, user_id)
+                else:
+                    response_text = await llm_client.generate_response(history_for_llm, user_id=user_id)
+        except SchedulerBusy as e:
+            print(f"LLM scheduler busy: {e}")
+            # Keep the message in history so the next turn still sees it
+            mark_turn_committed()
+            if user_turn:
+                await history_store.append(user_id, *user_turn)
+            await message.answer("⏳ Сейчас много обращений. Ваше сообщение сохранено, напишите через минуту, и я отвечу.")
+            return
+
+        # Separate the booking JSON from the user-facing text (already done while streaming)
+        if extractor is None:
+            with timer(STAGE_SECONDS, stage="booking_extract"):
+                extractor = extract_booking(response_text)
+
+        # Only plain answers are reusable: no booking JSON, no provider failure, not cut off
+        if not extractor.hidden and response_text != FALLBACK_RESPONSE and response_complete:
+            answer_cache.put(user_text, persona, stored_history, user_data, response_text)
+    else:
+        extractor = extract_booking(response_text)
 
-        # 2. Remove leftovers: Markdown code blocks and "json" labels
-        # Matches: ```json ... ```, ``` ... ```, or standalone "json" preceding the block
-        clean_text = re.sub(r"```(?:json)?\s*```", "", clean_text, flags=re.IGNORECASE)
+    # Post-processing (JSON parsing, Clean, TTS, History Update)
 
-        # 3. Remove standalone "json" word at the end of text (common if LLM outputs "Text... \n\n json \n {block}")
-        clean_text = re.sub(r"\bjson\s*$", "", clean_text, flags=re.IGNORECASE)
+    # Store original response for history (LLM memory should include what it generated, including JSON)
+    # However, if we strip JSON from user view, LLM context has it, which is correct (LLM knows it confirmed).
+    mark_turn_committed()
+    history_text = response_text if response_complete else response_text + INTERRUPTED_NOTE
+    await history_store.append(user_id, *user_turn, {"role": "assistant", "content": history_text})
 
-        response_text = clean_text.strip()
+    # A confirmed booking gets a confirmation card. Any JSON block is kept out of
+    # the user-facing text, valid booking or not, to prevent leakage.
+    booking_data = extractor.booking
+    response_text = extractor.text.strip()
 
-    # Strip Markdown from the user-facing text
-    clean_response_text = strip_markdown(response_text)
+    # Strip Markdown from the user-facing text; the speech version comes from the same scan
+    clean_response_text, tts_text = sanitize_reply(response_text)
 
     # Send Text
     if clean_response_text:
@@ -367,30 +584,40 @@ async def process_user_text(message: Message, user_text: str, is_voice_input: bo
              # Send "Recording voice..." action
             await message.bot.send_chat_action(chat_id=message.chat.id, action="record_voice")
 
-            # Generate voice
-            persona = _get_or_create_user_persona(user_id)
+            # Generate voice in the persona's mood
             mood = persona.get("mood", "professional")
 
-            voice_filename = f"reply_{user_id}_{message.message_id}.ogg"
-            # Use CLEAN text for TTS (no markdown, no JSON)
-            voice_path = await audio_client.text_to_speech(clean_response_text, voice_filename, mood=mood)
+            # Use CLEAN text for TTS (no markdown, no JSON, no emoji)
+            voice_reply = await audio_client.text_to_speech(tts_text, mood=mood, already_clean=True)
 
-            if voice_path and os.path.exists(voice_path):
-                voice_file = FSInputFile(voice_path)
-                try:
-                    await message.reply_voice(voice_file)
-                except Exception as e:
-                    print(f"Failed to send voice message: {e}")
-                os.remove(voice_path)
+            if voice_reply:
+                await send_voice_reply(message, voice_reply)
 
                 # Send text SECOND (caption/follow-up)
                 await message.answer(clean_response_text)
             else:
                 # Fallback: TTS failed, send text only
                 await message.answer(clean_response_text)
+        elif streamed_message:
+            # Streamed flow: replace the progressive text with the final clean text;
+            # whatever doesn't fit in one message follows as new messages
+            head = clean_response_text[:TELEGRAM_MESSAGE_LIMIT]
+            if head != streamed_text:
+                await edit_message_text(streamed_message, head)
+            for start in range(TELEGRAM_MESSAGE_LIMIT, len(clean_response_text), TELEGRAM_MESSAGE_LIMIT):
+                await message.answer(clean_response_text[start:start + TELEGRAM_MESSAGE_LIMIT])
         else:
             # Normal text flow
             await message.answer(clean_response_text)
+    elif streamed_message:
+        # Everything visible turned out to be part of a hidden block
+        try:
+            await streamed_message.delete()
+        except TelegramBadRequest as e:
+            # Already deleted, or too old for the bot to delete
+            print(f"Failed to delete streamed message: {e}")
+        except Exception as e:
+            print(f"Failed to delete streamed message: {e}")
 
     # Booking Confirmation Card
     if booking_data:
@@ -439,9 +666,12 @@ async def process_user_text(message: Message, user_text: str, is_voice_input: bo
             parse_mode="Markdown"
         )
 
+# Merges bursts of messages into one turn per user
+coalescer = MessageCoalescer(process_user_text)
+
 @router.message(F.text)
 async def handle_message(message: Message):
-    await process_user_text(message, message.text)
+    await coalescer.submit(message, message.text)
 
 @router.callback_query(F.data == "approve_application")
 async def approve_application(callback: CallbackQuery, bot: Bot):
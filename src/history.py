@@ -0,0 +1,160 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+from src.config import BOT_CONFIG
+from src.database import get_db
+from src.state import state_backend
+from src.metrics import timer, STAGE_SECONDS
+
+class HistoryStore:
+    """
+    Conversation history per user.
+    Active chats live in a bounded LRU dict; changes are written behind to the
+    'histories' collection (one document per user with a capped message array)
+    by a periodic flush, and on eviction or shutdown.
+    In shared mode (several replicas) the hot tier is bypassed: reads go to
+    Mongo and appends are applied there atomically with $push/$slice.
+    """
+    def __init__(self, max_users: int = None, max_turns: int = None, flush_interval: float = None, shared: bool = None):
+        history_config = BOT_CONFIG.get("history", {})
+        self.max_users = max_users if max_users is not None else history_config.get("max_users_in_memory", 1000)
+        self.max_turns = max_turns if max_turns is not None else history_config.get("max_turns", 25)
+        self.flush_interval = flush_interval if flush_interval is not None else history_config.get("flush_interval", 2)
+        self.shared = shared if shared is not None else state_backend.shared
+
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+
+    def _collection(self):
+        return get_db()["histories"]
+
+    async def _load(self, user_id):
+        """
+        Returns the live message list for user_id, loading it from Mongo on a miss.
+        A failed read raises and caches nothing: an empty list in the cache
+        would later be written over the stored conversation.
+        """
+        if user_id in self._cache:
+            self._cache.move_to_end(user_id)
+            return self._cache[user_id]
+
+        with timer(STAGE_SECONDS, stage="mongo_history_load"):
+            doc = await self._collection().find_one({"user_id": user_id})
+        messages = doc.get("messages", []) if doc else []
+
+        # Another task may have loaded (and appended to) it while we awaited
+        if user_id in self._cache:
+            self._cache.move_to_end(user_id)
+            return self._cache[user_id]
+
+        self._cache[user_id] = messages
+        await self._evict()
+        return messages
+
+    async def _evict(self):
+        while len(self._cache) > self.max_users:
+            user_id, messages = self._cache.popitem(last=False)
+            if user_id in self._dirty:
+                self._dirty.discard(user_id)
+                await self._persist(user_id, messages)
+
+    async def _upsert(self, user_id, update):
+        with timer(STAGE_SECONDS, stage="mongo_history_save"):
+            try:
+                await self._collection().update_one({"user_id": user_id}, update, upsert=True)
+            except DuplicateKeyError:
+                # Another replica created the document first; it exists now
+                await self._collection().update_one({"user_id": user_id}, update)
+
+    async def _persist(self, user_id, messages):
+        try:
+            await self._upsert(
+                user_id, {"$set": {"messages": messages[-self.max_turns:], "updated_at": datetime.now(timezone.utc)}}
+            )
+            return True
+        except Exception as e:
+            print(f"Error saving history for {user_id}: {e}")
+            return False
+
+    async def _push(self, user_id, messages):
+        """Appends to the stored history atomically ($push/$slice), without reading it."""
+        try:
+            await self._upsert(user_id, {
+                "$push": {"messages": {"$each": list(messages), "$slice": -self.max_turns}},
+                "$set": {"updated_at": datetime.now(timezone.utc)}
+            })
+        except Exception as e:
+            print(f"Error saving history for {user_id}: {e}")
+
+    async def get(self, user_id):
+        """Returns a copy of the user's history (empty if it can't be read right now)."""
+        try:
+            if self.shared:
+                with timer(STAGE_SECONDS, stage="mongo_history_load"):
+                    doc = await self._collection().find_one({"user_id": user_id})
+                return list(doc.get("messages", [])) if doc else []
+            return list(await self._load(user_id))
+        except Exception as e:
+            print(f"Error loading history for {user_id}: {e}")
+            return []
+
+    async def append(self, user_id, *messages):
+        """Appends messages and trims the history to max_turns."""
+        if self.shared:
+            await self._push(user_id, messages)
+            return
+
+        try:
+            history = await self._load(user_id)
+        except Exception as e:
+            # Not cached: append in Mongo directly, the next access retries the read
+            print(f"Error loading history for {user_id}, appending in place: {e}")
+            await self._push(user_id, messages)
+            return
+        history.extend(messages)
+        if len(history) > self.max_turns:
+            del history[:-self.max_turns]
+        self._dirty.add(user_id)
+
+    async def clear(self, user_id):
+        if self.shared:
+            await self._persist(user_id, [])
+            return
+        self._cache[user_id] = []
+        self._cache.move_to_end(user_id)
+        self._dirty.add(user_id)
+        await self._evict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def message_count(self):
+        """Messages across all histories held in memory."""
+        return sum(len(messages) for messages in self._cache.values())
+
+    async def flush(self):
+        """Writes all pending changes to Mongo. Failed writes stay dirty for the next flush."""
+        for user_id in list(self._dirty):
+            if user_id not in self._cache:
+                self._dirty.discard(user_id)
+                continue
+            self._dirty.discard(user_id)
+            if not await self._persist(user_id, self._cache[user_id]):
+                self._dirty.add(user_id)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
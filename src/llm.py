@@ -1,50 +1,293 @@
 import os
+import time
+import random
 import asyncio
-from openai import AsyncOpenAI
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError, APIConnectionError
 from src.database import get_services_context
 from src.config import LLM_CONFIG
 from src.prompts import load_prompt_template
+from src.tokens import message_tokens, trim_history
+from src.metrics import timer, STAGE_SECONDS, LLM_REQUESTS
+from src.tracing import record
 
-class LLMClient:
-    def __init__(self):
-        provider_config = LLM_CONFIG.get("provider", {})
+FALLBACK_RESPONSE = "Извините, сейчас я не могу ответить. Пожалуйста, попробуйте позже."
+
+class StreamInterrupted(Exception):
+    """Raised by stream_response when the stream fails after part of the reply was yielded."""
+
+def _is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def _retry_after(error):
+    """Seconds requested by the provider's Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and skips the provider
+    for reset_timeout seconds. After that a single trial request is let
+    through; a success closes the breaker again, a failure re-opens it.
+    """
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def allow(self):
+        """
+        Claims the trial when the breaker is half-open, so only the first
+        caller gets True. A trial that never reports back (cancelled, or
+        claimed but not used) is given up after another reset_timeout.
+        """
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+            return False
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        # A failed trial re-opens the breaker straight away
+        if self.trial_started_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_started_at = None
+
+class Provider:
+    """One OpenAI-compatible endpoint from the 'providers' list in llm_config.yaml."""
+    def __init__(self, config: dict, breaker_config: dict):
+        self.name = config.get("name", config.get("base_url", "provider"))
+        self.model = config.get("model", "llama-3.1-8b-instant")
+        self.timeout = config.get("timeout", 30)
+        # Retries are handled by LLMClient so they can fail over between providers
         self.client = AsyncOpenAI(
-            base_url=provider_config.get("base_url", "https://api.groq.com/openai/v1"),
-            api_key=os.getenv("GROQ_API_KEY")
+            base_url=config.get("base_url", "https://api.groq.com/openai/v1"),
+            api_key=os.getenv(config.get("api_key_env", "GROQ_API_KEY")),
+            timeout=self.timeout,
+            max_retries=0
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=breaker_config.get("failure_threshold", 3),
+            reset_timeout=breaker_config.get("reset_timeout", 30)
         )
-        self.model = provider_config.get("model", "llama-3.1-8b-instant")
-        self.params = LLM_CONFIG.get("parameters", {"temperature": 0.6, "max_tokens": 512, "top_p": 1.0})
 
-    def _get_system_prompt(self, user_id=None):
-        try:
-            services_text = get_services_context()
-        except Exception as e:
-            services_text = "Error fetching services. Please ask the developer to check the database."
-            print(f"Error fetching services context: {e}")
+class LLMClient:
+    def __init__(self, config: dict = None):
+        config = config if config is not None else LLM_CONFIG
+        # 'providers' is an ordered failover list; a lone 'provider' section still works
+        provider_configs = config.get("providers") or [config.get("provider", {})]
+        breaker_config = config.get("circuit_breaker", {})
+        self.providers = [Provider(p, breaker_config) for p in provider_configs]
+
+        # Primary provider, kept for callers that use the client directly
+        self.client = self.providers[0].client
+        self.model = self.providers[0].model
+
+        self.params = config.get("parameters", {"temperature": 0.6, "max_tokens": 512, "top_p": 1.0})
+        self.context = config.get("context", {})
+        self.retry = config.get("retry", {})
+        self.hedging = config.get("hedging", {})
+
+    async def _get_system_prompt(self, user_id=None):
+        # Served from memory; falls back to the built-in price list if Mongo is down
+        services_text = await get_services_context()
 
         # Load the current template dynamically, optionally personalized by user_id
-        template = load_prompt_template(user_id=user_id)
+        template = await load_prompt_template(user_id=user_id)
         return template.render(services_context=services_text)
 
+    def _build_messages(self, system_prompt, history):
+        """
+        Prepends the system prompt and drops the oldest history so the whole
+        prompt (system prompt with services context + history) fits in
+        context.max_prompt_tokens.
+        """
+        system_message = {"role": "system", "content": system_prompt}
+        budget = self.context.get("max_prompt_tokens", 4000) - message_tokens(system_message)
+        history = trim_history(history, budget, min_messages=self.context.get("min_messages", 1))
+        return [system_message] + history
+
+    def _request_params(self, messages):
+        return {
+            "messages": messages,
+            "temperature": self.params.get("temperature", 0.6),
+            "max_tokens": self.params.get("max_tokens", 512),
+            "top_p": self.params.get("top_p", 1.0),
+        }
+
+    def _available_providers(self):
+        # If every breaker is open, try them all rather than fail without asking anyone.
+        # allow() claims half-open trials, so call it once per request
+        return [p for p in self.providers if p.breaker.allow()] or list(self.providers)
+
+    async def _call_with_retry(self, provider, request):
+        """
+        Calls one provider, retrying 429/5xx/timeouts with jittered exponential
+        backoff. A Retry-After header is honoured; if it asks for longer than
+        max_delay we give up on this provider and let the caller fail over.
+        Failures are recorded on the provider's breaker here; the caller only
+        records the success, which for a stream means the whole stream.
+        """
+        attempts = self.retry.get("attempts", 3)
+        base_delay = self.retry.get("base_delay", 0.5)
+        max_delay = self.retry.get("max_delay", 8)
+
+        for attempt in range(attempts):
+            try:
+                response = await provider.client.chat.completions.create(model=provider.model, **request)
+                LLM_REQUESTS.labels(provider=provider.name, outcome="ok").inc()
+                return response
+            except Exception as e:
+                if not _is_retryable(e) or attempt == attempts - 1:
+                    LLM_REQUESTS.labels(provider=provider.name, outcome="error").inc()
+                    provider.breaker.record_failure()
+                    raise
+                LLM_REQUESTS.labels(provider=provider.name, outcome="retry").inc()
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                elif delay > max_delay:
+                    LLM_REQUESTS.labels(provider=provider.name, outcome="error").inc()
+                    provider.breaker.record_failure()
+                    raise
+                print(f"LLM provider {provider.name} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _complete(self, request):
+        """
+        Runs a non-streaming completion across providers in order.
+        A provider is started when the previous one failed or, with hedging
+        enabled, when it has not answered within hedging.delay seconds.
+        The first successful answer wins and the others are cancelled.
+        """
+        candidates = self._available_providers()
+        hedge_delay = self.hedging.get("delay", 3.0) if self.hedging.get("enabled", False) else None
+
+        tasks = {}
+        last_error = None
+
+        def launch():
+            provider = candidates[len(tasks)]
+            tasks[asyncio.create_task(self._call_with_retry(provider, request))] = provider
+
+        launch()
+        try:
+            while True:
+                pending = {task for task in tasks if not task.done()}
+                if not pending:
+                    if len(tasks) < len(candidates):
+                        launch()
+                        continue
+                    raise last_error
+
+                can_hedge = hedge_delay is not None and len(tasks) < len(candidates)
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Still waiting on a slow provider: hedge on the next one
+                    launch()
+                    continue
+
+                for task in done:
+                    provider = tasks[task]
+                    if task.exception() is None:
+                        provider.breaker.record_success()
+                        return task.result()
+                    # The breaker failure was recorded by _call_with_retry
+                    last_error = task.exception()
+                    print(f"LLM provider {provider.name} failed: {last_error}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def generate_response(self, history, user_id=None):
         """
         Non-streaming response generation.
         """
-        system_prompt = self._get_system_prompt(user_id=user_id)
-        messages = [{"role": "system", "content": system_prompt}] + history
+        with timer(STAGE_SECONDS, stage="prompt_build"):
+            system_prompt = await self._get_system_prompt(user_id=user_id)
+            messages = self._build_messages(system_prompt, history)
 
         try:
-            chat_completion = await self.client.chat.completions.create(
-                messages=messages,
-                model=self.model,
-                temperature=self.params.get("temperature", 0.6),
-                max_tokens=self.params.get("max_tokens", 512),
-                top_p=self.params.get("top_p", 1.0)
-            )
+            with timer(STAGE_SECONDS, stage="llm"):
+                chat_completion = await self._complete(self._request_params(messages))
             return chat_completion.choices[0].message.content
         except Exception as e:
             print(f"LLM Error: {e}")
-            return "Извините, сейчас я не могу ответить. Пожалуйста, попробуйте позже."
+            return FALLBACK_RESPONSE
+
+    async def stream_response(self, history, user_id=None):
+        """
+        Streaming response generation. Yields text chunks as they arrive.
+        Fails over to the next provider only until the first chunk is out;
+        a reply that is already visible is never restarted. A failure after
+        that raises StreamInterrupted, so the caller knows the text it has
+        is cut off.
+        """
+        with timer(STAGE_SECONDS, stage="prompt_build"):
+            system_prompt = await self._get_system_prompt(user_id=user_id)
+            request = dict(self._request_params(self._build_messages(system_prompt, history)), stream=True)
+
+        started_at = time.perf_counter()
+        produced = False
+        for provider in self._available_providers():
+            stream = None
+            try:
+                stream = await self._call_with_retry(provider, request)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not produced:
+                            STAGE_SECONDS.labels(stage="llm_first_token").observe(time.perf_counter() - started_at)
+                        produced = True
+                        yield chunk.choices[0].delta.content
+                STAGE_SECONDS.labels(stage="llm").observe(time.perf_counter() - started_at)
+                # Streamed across yields, so recorded once finished rather than as a with-block
+                record("llm", started_at, provider=provider.name)
+                provider.breaker.record_success()
+                return
+            except Exception as e:
+                # Failures to open the stream were recorded by _call_with_retry
+                if stream is not None:
+                    provider.breaker.record_failure()
+                print(f"LLM Error ({provider.name}): {e}")
+                # Don't restart or tack an apology onto a reply that is already half visible
+                if produced:
+                    raise StreamInterrupted(f"{provider.name}: {e}") from e
+
+        # Every provider failed before producing any text
+        yield FALLBACK_RESPONSE
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
@@ -0,0 +1,260 @@
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from aiohttp import web
+from src.config import BOT_CONFIG
+from src.tracing import span
+
+# Seconds; covers sub-millisecond cache hits up to slow LLM replies
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric(ABC):
+    """Base for metrics with optional labels. Children are created on first use and kept."""
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _samples(self):
+        """Yields (suffix, label values, extra label, value)."""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def _samples(self):
+        for key, child in self._children.items():
+            yield "_total" if not self.name.endswith("_total") else "", key, "", child.value
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is computed by a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), function=None):
+        super().__init__(name, help_text, labelnames)
+        self._function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, function):
+        """Reads the value from function() on every scrape instead of storing it."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            yield "", (), "", self._function()
+            return
+        for key, child in self._children.items():
+            yield "", key, "", child.value
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def totals(self):
+        """{label values: (count, sum)}, for quick summaries outside Prometheus."""
+        return {key: (child.count, child.sum) for key, child in self._children.items()}
+
+    def _samples(self):
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                yield "_bucket", key, f'le="{_format_value(float(bound))}"', cumulative
+            yield "_sum", key, "", child.sum
+            yield "_count", key, "", child.count
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), function=None):
+        return self._register(Gauge(name, help_text, labelnames, function))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+registry = Registry()
+
+# --- Pipeline metrics ---
+
+STAGE_SECONDS = registry.histogram(
+    "bot_stage_duration_seconds", "Time spent in one stage of handling a message", ("stage",)
+)
+UPDATE_SECONDS = registry.histogram(
+    "bot_update_duration_seconds", "Time to handle one Telegram update end to end", ("type",)
+)
+RATE_LIMIT_DECISIONS = registry.counter(
+    "bot_rate_limit_decisions_total", "Rate limiter decisions", ("kind", "decision")
+)
+LLM_REQUESTS = registry.counter(
+    "bot_llm_requests_total", "LLM provider calls by outcome", ("provider", "outcome")
+)
+TELEGRAM_SECONDS = registry.histogram(
+    "bot_telegram_request_duration_seconds", "Bot API request time", ("method",)
+)
+TELEGRAM_ERRORS = registry.counter(
+    "bot_telegram_errors_total", "Failed Bot API requests", ("method",)
+)
+ACTIVE_USERS = registry.gauge(
+    "bot_active_users", "Users with an update in the last active_window seconds"
+)
+UPDATES_IN_PROGRESS = registry.gauge(
+    "bot_updates_in_progress", "Updates currently being handled"
+)
+HISTORY_USERS = registry.gauge(
+    "bot_history_users_in_memory", "Conversation histories held in memory"
+)
+HISTORY_MESSAGES = registry.gauge(
+    "bot_history_messages_in_memory", "Messages across all in-memory histories"
+)
+CACHE_LOOKUPS = registry.counter(
+    "bot_cache_lookups_total", "Cache lookups by where the value was found", ("cache", "result")
+)
+
+class timer:
+    """
+    Observes the elapsed time of a with-block into a histogram:
+        with timer(STAGE_SECONDS, stage="llm"):
+            ...
+    Works inside coroutines too (the block may await). Inside a trace the
+    block is also recorded as a span named after the label values.
+    """
+    __slots__ = ("_child", "_start", "_span")
+
+    def __init__(self, histogram, **labels):
+        self._child = histogram.labels(**labels) if labels else histogram._children[()]
+        self._span = span(":".join(map(str, labels.values())) or histogram.name)
+
+    def __enter__(self):
+        self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+async def start_metrics_server():
+    """Serves registry.render() over HTTP per the metrics config. Returns the runner, or None when disabled."""
+    metrics_config = BOT_CONFIG.get("metrics", {})
+    if not metrics_config.get("enabled", False):
+        return None
+
+    async def handle(request):
+        return web.Response(text=registry.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get(metrics_config.get("path", "/metrics"), handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, metrics_config.get("host", "127.0.0.1"), metrics_config.get("port", 9090)).start()
+    return runner
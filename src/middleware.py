@@ -1,43 +1,253 @@
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Message, CallbackQuery
 import time
+import asyncio
 from src.config import BOT_CONFIG
+from src.state import state_backend
+from src.metrics import (
+    timer, STAGE_SECONDS, UPDATE_SECONDS, RATE_LIMIT_DECISIONS, TELEGRAM_SECONDS, TELEGRAM_ERRORS
+)
+from src.tracing import trace, profiler
 
 class RateLimitMiddleware(BaseMiddleware):
-    def __init__(self, limit: int = None, window: int = None):
+    """
+    Per-user rate limiting with separate budgets for text, voice and callbacks
+    (voice costs STT + LLM + TTS). Each budget is 'burst' events refilled at
+    'rate' per second.
+    Locally this is a token bucket: two floats per (kind, user), idle users are
+    evicted periodically. With a shared state backend it is a sliding-window
+    counter in the backend so all replicas enforce the same limit.
+    Over-limit events get a "slow down" reply (once per window) unless the
+    reply is configured empty.
+    """
+    def __init__(self, limits: dict = None, idle_ttl: float = None, reply: str = None, backend=None):
         """
-        limit: Max messages allowed (defaults to config)
-        window: Time window in seconds (defaults to config)
+        limits: {"text"|"voice"|"callback": {"rate": per second, "burst": max}} (defaults to config)
+        idle_ttl: Seconds after which an idle user's bucket is forgotten (defaults to config)
+        reply: Text sent when a user is limited; empty for a silent drop (defaults to config)
+        backend: StateBackend used when it is shared between replicas (defaults to the state backend)
         """
         rl_config = BOT_CONFIG.get("rate_limit", {})
-        self.limit = limit if limit is not None else rl_config.get("limit", 2)
-        self.window = window if window is not None else rl_config.get("window", 5)
+        # Legacy 'limit'/'window' keys still define the text budget
+        legacy_limit = rl_config.get("limit", 2)
+        legacy_text = {"rate": legacy_limit / rl_config.get("window", 3), "burst": legacy_limit}
 
-        self.user_requests = {}
+        self.limits = {
+            "text": rl_config.get("text", legacy_text),
+            "voice": rl_config.get("voice", {"rate": 0.2, "burst": 1}),
+            "callback": rl_config.get("callback", {"rate": 2, "burst": 5}),
+        }
+        if limits:
+            self.limits.update(limits)
+        self.idle_ttl = idle_ttl if idle_ttl is not None else rl_config.get("idle_ttl", 300)
+        self.reply = reply if reply is not None else rl_config.get(
+            "reply", "⏳ Пожалуйста, не так быстро. Подождите пару секунд и повторите."
+        )
+        self.backend = backend if backend is not None else state_backend
+
+        # (kind, user_id) -> [tokens, updated_at, notified_at]
+        self._buckets = {}
+        self._next_sweep = time.monotonic() + self.idle_ttl
+
+    @staticmethod
+    def _kind(event):
+        if isinstance(event, CallbackQuery):
+            return "callback"
+        if event.voice or event.audio or event.video_note:
+            return "voice"
+        return "text"
+
+    def _window(self, kind):
+        limit = self.limits[kind]
+        return limit["burst"] / limit["rate"]
+
+    def _sweep(self, now):
+        """Drops buckets idle long enough to have refilled completely."""
+        self._next_sweep = now + self.idle_ttl
+        stale = [key for key, bucket in self._buckets.items() if now - bucket[1] > self.idle_ttl]
+        for key in stale:
+            del self._buckets[key]
+
+    def _allow_local(self, kind, user_id, now):
+        """Token bucket. Returns (allowed, notify)."""
+        limit = self.limits[kind]
+        bucket = self._buckets.get((kind, user_id))
+        if bucket is None:
+            bucket = self._buckets[(kind, user_id)] = [limit["burst"], now, 0.0]
+        else:
+            bucket[0] = min(limit["burst"], bucket[0] + (now - bucket[1]) * limit["rate"])
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True, False
+
+        notify = now - bucket[2] >= self._window(kind)
+        if notify:
+            bucket[2] = now
+        return False, notify
+
+    async def _allow_shared(self, kind, user_id):
+        """Sliding-window counter over two fixed windows in the backend. Returns (allowed, notify)."""
+        window = self._window(kind)
+        now = time.time()
+        index = int(now // window)
+        elapsed = (now % window) / window
+
+        current = await self.backend.incr(f"rl:{kind}:{user_id}:{index}", ttl=2 * window)
+        previous = await self.backend.get(f"rl:{kind}:{user_id}:{index - 1}", 0)
+        if previous * (1 - elapsed) + current <= self.limits[kind]["burst"]:
+            return True, False
+
+        notify = await self.backend.incr(f"rl:notice:{kind}:{user_id}:{index}", ttl=window) == 1
+        return False, notify
 
     async def __call__(
         self,
         handler,
-        event: Message,
+        event,
         data: dict
     ):
-        # Only rate limit messages
-        if not isinstance(event, Message):
+        # Only rate limit messages and callbacks
+        if not isinstance(event, (Message, CallbackQuery)) or event.from_user is None:
              return await handler(event, data)
 
         user_id = event.from_user.id
-        current_time = time.time()
+        kind = self._kind(event)
+
+        with timer(STAGE_SECONDS, stage="rate_limit"):
+            if self.backend.shared:
+                allowed, notify = await self._allow_shared(kind, user_id)
+            else:
+                now = time.monotonic()
+                if now >= self._next_sweep:
+                    self._sweep(now)
+                allowed, notify = self._allow_local(kind, user_id, now)
+        RATE_LIMIT_DECISIONS.labels(kind=kind, decision="allowed" if allowed else "limited").inc()
+
+        if allowed:
+            return await handler(event, data)
+
+        if notify and self.reply:
+            try:
+                # A chat message for messages, a toast for callbacks
+                await event.answer(self.reply)
+            except Exception as e:
+                print(f"Failed to send rate limit notice: {e}")
+
+class UpdateTracker(BaseMiddleware):
+    """
+    Outer update middleware that counts updates being processed,
+    so shutdown can wait for them to finish. Updates that arrive with
+    data["update_tracked"] were already counted by whoever accepted them
+    (see the webhook request handler in bot.py).
+    """
+    def __init__(self):
+        self.active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def begin(self):
+        self.active += 1
+        self._idle.clear()
+
+    def end(self):
+        self.active -= 1
+        if not self.active:
+            self._idle.set()
+
+    async def __call__(self, handler, event, data: dict):
+        if data.get("update_tracked"):
+            return await handler(event, data)
+        self.begin()
+        try:
+            return await handler(event, data)
+        finally:
+            self.end()
+
+    async def wait_idle(self, timeout: float = None):
+        """Waits until no update is in progress. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Outer update middleware recording handling time per update type and
+    which users were active recently (for the bot_active_users gauge).
+    """
+    def __init__(self, active_window: float = None, enabled: bool = None):
+        metrics_config = BOT_CONFIG.get("metrics", {})
+        self.active_window = active_window if active_window is not None else metrics_config.get("active_window", 300)
+        # Nobody reads the active users gauge when metrics are off
+        self.enabled = enabled if enabled is not None else metrics_config.get("enabled", False)
+        # user_id -> monotonic time of the last update
+        self._last_seen = {}
+        self._next_sweep = time.monotonic() + self.active_window
+
+    def _sweep(self, now):
+        """Forgets users not seen within active_window."""
+        self._next_sweep = now + self.active_window
+        cutoff = now - self.active_window
+        stale = [user_id for user_id, seen in self._last_seen.items() if seen < cutoff]
+        for user_id in stale:
+            del self._last_seen[user_id]
+
+    def active_users(self):
+        """Counts users seen within active_window. Called at scrape time."""
+        self._sweep(time.monotonic())
+        return len(self._last_seen)
 
-        # Clean up old requests
-        if user_id not in self.user_requests:
-            self.user_requests[user_id] = []
+    async def __call__(self, handler, event, data: dict):
+        user = data.get("event_from_user")
+        if self.enabled and user is not None:
+            now = time.monotonic()
+            self._last_seen[user.id] = now
+            # Also swept here, so the dict stays bounded when nothing scrapes
+            if now >= self._next_sweep:
+                self._sweep(now)
+        with timer(UPDATE_SECONDS, type=event.event_type):
+            return await handler(event, data)
 
-        # Filter timestamps within the window
-        self.user_requests[user_id] = [t for t in self.user_requests[user_id] if current_time - t < self.window]
+class TracingMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that opens a trace per update (trace id in
+    data["trace_id"]); timed stages below it become spans, and slow updates
+    are logged with their span tree. Also counts updates for the profiler
+    started by /profiling, posting the report to the admin chat when done.
+    """
+    async def __call__(self, handler, event, data: dict):
+        user = data.get("event_from_user")
+        # The update that starts profiling doesn't count towards it
+        profiled = profiler.active
+        try:
+            with trace("update", type=event.event_type, user_id=user.id if user else None) as update_trace:
+                data["trace_id"] = update_trace.trace_id
+                return await handler(event, data)
+        finally:
+            if profiled:
+                await self._count_profiled(data["bot"])
 
-        if len(self.user_requests[user_id]) >= self.limit:
-            # Drop the request
-            return
+    @staticmethod
+    async def _count_profiled(bot):
+        chat_id = profiler.chat_id
+        report = profiler.update_done()
+        if report:
+            try:
+                await bot.send_message(chat_id, report)
+            except Exception as e:
+                print(f"Failed to send profile report: {e}")
 
-        self.user_requests[user_id].append(current_time)
-        return await handler(event, data)
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing every Bot API request by method."""
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        try:
+            with timer(TELEGRAM_SECONDS, method=name):
+                return await make_request(bot, method)
+        except Exception:
+            TELEGRAM_ERRORS.labels(method=name).inc()
+            raise
@@ -1,6 +1,11 @@
 import os
 import random
+from functools import lru_cache
+from itertools import product
 from jinja2 import Template, Environment, FileSystemLoader
+from src.cache import TTLCache
+from src.config import BOT_CONFIG
+from src.state import state_backend
 
 PROMPTS_DIR = os.path.join(os.getcwd(), 'config', 'prompts')
 DEFAULT_MODE = "default"
@@ -8,22 +13,32 @@ DEFAULT_MODE = "default"
 # Setup Jinja2 Environment for modular loading
 jinja_env = Environment(loader=FileSystemLoader(PROMPTS_DIR))
 
-# Global state to store the current mode (Legacy/Base mode)
-_current_mode = DEFAULT_MODE
+# Persona used for generic calls without a user_id
+DEFAULT_PERSONA = {"mood": "professional", "style": "concise", "thought": "analytical"}
 
-# In-memory storage for user persona seeds
-# Format: {user_id: {"mood": "...", "style": "...", "thought": "..."}}
-_user_personas = {}
+# Upper bound on memoized persona prompts (3x3x3 = 27 today)
+PROMPT_CACHE_SIZE = 128
 
-def get_current_mode():
-    return _current_mode
+FALLBACK_TEMPLATE = Template("You are a helpful assistant. {{ services_context }}")
 
-def set_mode(mode_name):
+# The current mode (Legacy/Base mode) and user persona seeds live in the state
+# backend so every replica sees the same values.
+# Persona format: {"mood": "...", "style": "...", "thought": "..."}
+MODE_KEY = "mode"
+PERSONA_KEY = "persona:{user_id}"
+PERSONA_TTL = BOT_CONFIG.get("state", {}).get("persona_ttl", 30 * 24 * 3600)
+
+# A persona never changes once stored, so replicas may keep a local copy
+_persona_cache = TTLCache(max_entries=10000, ttl=3600)
+
+async def get_current_mode():
+    return await state_backend.get(MODE_KEY, DEFAULT_MODE)
+
+async def set_mode(mode_name):
     """Sets the global bot mode if the prompt file exists (Legacy support)."""
-    global _current_mode
     path = os.path.join(PROMPTS_DIR, f"{mode_name}.j2")
     if os.path.exists(path):
-        _current_mode = mode_name
+        await state_backend.set(MODE_KEY, mode_name)
         return True
     return False
 
@@ -46,75 +61,101 @@ def _get_random_template_content(category):
         print(f"Error reading template {path}: {e}")
         return ""
 
-def _get_or_create_user_persona(user_id):
+def _list_options(category):
+    """Lists template names (without .j2) in a persona subdirectory."""
+    category_dir = os.path.join(PROMPTS_DIR, category)
+    if not os.path.exists(category_dir):
+        return []
+    return sorted(f.replace('.j2', '') for f in os.listdir(category_dir) if f.endswith('.j2'))
+
+async def _get_or_create_user_persona(user_id):
     """Gets existing persona for user or creates a new random one."""
-    if user_id not in _user_personas:
-        # Determine options dynamically from directories
-        moods = [f.replace('.j2','') for f in os.listdir(os.path.join(PROMPTS_DIR, 'mood')) if f.endswith('.j2')]
-        styles = [f.replace('.j2','') for f in os.listdir(os.path.join(PROMPTS_DIR, 'style')) if f.endswith('.j2')]
-        thoughts = [f.replace('.j2','') for f in os.listdir(os.path.join(PROMPTS_DIR, 'thought')) if f.endswith('.j2')]
-
-        _user_personas[user_id] = {
-            "mood": random.choice(moods) if moods else "professional",
-            "style": random.choice(styles) if styles else "concise",
-            "thought": random.choice(thoughts) if thoughts else "analytical"
-        }
-    return _user_personas[user_id]
-
-def load_prompt_template(user_id=None):
-    """
-    Constructs a dynamic 'Consciousness Web' prompt for the user.
-    Combines Core + Mood + Style + Thought.
-    """
+    persona = _persona_cache.get(user_id)
+    if persona is not None:
+        return persona
+
+    # Determine options dynamically from directories
+    moods = _list_options('mood')
+    styles = _list_options('style')
+    thoughts = _list_options('thought')
+
+    candidate = {
+        "mood": random.choice(moods) if moods else "professional",
+        "style": random.choice(styles) if styles else "concise",
+        "thought": random.choice(thoughts) if thoughts else "analytical"
+    }
+    # If another replica created one first, theirs wins
+    persona = await state_backend.setdefault(PERSONA_KEY.format(user_id=user_id), candidate, ttl=PERSONA_TTL)
+    _persona_cache.set(user_id, persona)
+    return persona
+
+def _render_fragment(template_name):
+    """Renders a persona fragment, returning an empty string if it is missing or broken."""
     try:
-        # 1. Load Base Core (Secretary)
-        core_template = jinja_env.get_template("core/secretary.j2")
-        base_prompt = core_template.render()
-
-        # 2. Get User Persona (Randomized but consistent per session)
-        if user_id:
-            persona = _get_or_create_user_persona(user_id)
-            mood_file = f"mood/{persona['mood']}.j2"
-            style_file = f"style/{persona['style']}.j2"
-            thought_file = f"thought/{persona['thought']}.j2"
-        else:
-            # Fallback for generic calls
-            mood_file = "mood/professional.j2"
-            style_file = "style/concise.j2"
-            thought_file = "thought/analytical.j2"
-
-        # 3. Load Components
-        try:
-            mood_text = jinja_env.get_template(mood_file).render()
-        except: mood_text = ""
-
-        try:
-            style_text = jinja_env.get_template(style_file).render()
-        except: style_text = ""
+        return jinja_env.get_template(template_name).render()
+    except Exception as e:
+        print(f"Error rendering template {template_name}: {e}")
+        return ""
 
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _compile_prompt(mood, style, thought):
+    """
+    Builds and compiles the system prompt for one persona combination.
+    Memoized, so each combination is rendered and compiled only once; the
+    returned Template only needs services_context at render time.
+    """
+    # 1. Load Base Core (Secretary)
+    base_prompt = jinja_env.get_template("core/secretary.j2").render()
+
+    # 2. Load Components
+    mood_text = _render_fragment(f"mood/{mood}.j2")
+    style_text = _render_fragment(f"style/{style}.j2")
+    thought_text = _render_fragment(f"thought/{thought}.j2")
+
+    # 3. Weave together
+    # We manually concatenate them because the 'system prompt' is the sum of these instructions.
+    # In a more advanced version, we could use a master .j2 that includes them.
+    full_prompt_str = (
+        f"{base_prompt}\n\n"
+        f"--- PERSONALITY MODULES ---\n"
+        f"{mood_text}\n\n"
+        f"{style_text}\n\n"
+        f"{thought_text}\n\n"
+        f"--- CONTEXT ---\n"
+        "{{ services_context }}"
+    )
+
+    return Template(full_prompt_str)
+
+def warm_prompt_cache():
+    """Precompiles every mood/style/thought combination. Returns how many were built."""
+    count = 0
+    for mood, style, thought in product(_list_options('mood'), _list_options('style'), _list_options('thought')):
         try:
-            thought_text = jinja_env.get_template(thought_file).render()
-        except: thought_text = ""
-
-        # 4. Weave together
-        # We manually concatenate them because the 'system prompt' is the sum of these instructions.
-        # In a more advanced version, we could use a master .j2 that includes them.
+            _compile_prompt(mood, style, thought)
+            count += 1
+        except Exception as e:
+            print(f"Error precompiling prompt {mood}/{style}/{thought}: {e}")
+    return count
 
-        full_prompt_str = (
-            f"{base_prompt}\n\n"
-            f"--- PERSONALITY MODULES ---\n"
-            f"{mood_text}\n\n"
-            f"{style_text}\n\n"
-            f"{thought_text}\n\n"
-            f"--- CONTEXT ---\n"
-            "{{ services_context }}"
-        )
-
-        return Template(full_prompt_str)
+async def load_prompt_template(user_id=None):
+    """
+    Returns the compiled 'Consciousness Web' prompt for the user.
+    Combines Core + Mood + Style + Thought.
+    """
+    # Get User Persona (Randomized but consistent per session)
+    if user_id:
+        persona = await _get_or_create_user_persona(user_id)
+    else:
+        # Fallback for generic calls
+        persona = DEFAULT_PERSONA
 
+    try:
+        return _compile_prompt(persona["mood"], persona["style"], persona["thought"])
     except Exception as e:
+        # Not memoized, so a fixed template file is picked up on the next call
         print(f"Error constructing dynamic prompt: {e}")
-        return Template("You are a helpful assistant. {{ services_context }}")
+        return FALLBACK_TEMPLATE
 
 def list_modes():
     """Lists available prompt modes based on files in config/prompts."""
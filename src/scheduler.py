@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from src.config import LLM_CONFIG
+from src.tracing import span
+
+# Priority lanes, lower value is served first
+PRIORITY_BOOKING = 0
+PRIORITY_CHAT = 1
+LANES = {PRIORITY_BOOKING: "booking", PRIORITY_CHAT: "chat"}
+
+class SchedulerBusy(Exception):
+    """Raised when the waiting queue is full."""
+
+class LLMScheduler:
+    """
+    Admission control in front of LLMClient.
+    At most max_concurrency provider calls run at once and every user has at
+    most one call in flight. Waiting requests are served by priority lane,
+    then in arrival order.
+    """
+    def __init__(self, max_concurrency: int = None, max_queue: int = None):
+        scheduler_config = LLM_CONFIG.get("scheduler", {})
+        self.max_concurrency = max_concurrency if max_concurrency is not None else scheduler_config.get("max_concurrency", 8)
+        self.max_queue = max_queue if max_queue is not None else scheduler_config.get("max_queue", 500)
+
+        # Heap of (priority, seq, user_id, future, enqueued_at)
+        self._queue = []
+        self._seq = itertools.count()
+        self._active_users = set()
+        self._in_flight = 0
+
+        # Monitoring counters per lane
+        self._served = {lane: 0 for lane in LANES}
+        self._wait_total = {lane: 0.0 for lane in LANES}
+        self._wait_max = {lane: 0.0 for lane in LANES}
+        self._rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, user_id, priority: int = PRIORITY_CHAT):
+        """Waits for an LLM slot for user_id and holds it for the duration of the block."""
+        with span("llm_queue", priority=priority):
+            await self._acquire(user_id, priority)
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    async def _acquire(self, user_id, priority):
+        if self.max_queue and len(self._queue) >= self.max_queue:
+            self._rejected += 1
+            raise SchedulerBusy(f"LLM queue is full ({len(self._queue)} waiting)")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), user_id, future, time.monotonic()))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been granted in the same tick we were cancelled
+            if future.done() and not future.cancelled():
+                self._release(user_id)
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+
+    def _release(self, user_id):
+        self._in_flight -= 1
+        self._active_users.discard(user_id)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grants free slots to the best waiting requests whose user is not already running."""
+        skipped = []
+        while self._queue and self._in_flight < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            priority, _, user_id, future, enqueued_at = entry
+            if future.done():
+                continue
+            if user_id in self._active_users:
+                skipped.append(entry)
+                continue
+
+            waited = time.monotonic() - enqueued_at
+            self._served[priority] += 1
+            self._wait_total[priority] += waited
+            self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+            self._in_flight += 1
+            self._active_users.add(user_id)
+            future.set_result(None)
+
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        # Drop cancelled waiters so queue depth stays accurate
+        if any(entry[3].done() for entry in self._queue):
+            self._queue = [entry for entry in self._queue if not entry[3].done()]
+            heapq.heapify(self._queue)
+
+    def stats(self):
+        """Queue depth, in-flight calls and wait times per lane, for monitoring."""
+        lanes = {}
+        for priority, name in LANES.items():
+            served = self._served[priority]
+            lanes[name] = {
+                "queued": sum(1 for entry in self._queue if entry[0] == priority),
+                "served": served,
+                "avg_wait": self._wait_total[priority] / served if served else 0.0,
+                "max_wait": self._wait_max[priority],
+            }
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._queue),
+            "rejected": self._rejected,
+            "lanes": lanes,
+        }
@@ -0,0 +1,76 @@
+import sys
+import math
+from array import array
+from operator import mul
+
+# PCM here is always signed 16-bit little-endian mono (ffmpeg "-f s16le -ac 1")
+SAMPLE_WIDTH = 2
+FULL_SCALE = 32768.0
+
+def _samples(pcm: bytes) -> array:
+    samples = array("h", pcm[:len(pcm) - len(pcm) % SAMPLE_WIDTH])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+def frame_levels(pcm: bytes, sample_rate: int, frame_ms: int = 30) -> list:
+    """Per-frame RMS level in dBFS (-inf dB for digital silence)."""
+    samples = _samples(pcm)
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    levels = []
+    for start in range(0, len(samples), frame_len):
+        frame = samples[start:start + frame_len]
+        energy = sum(map(mul, frame, frame)) / len(frame)
+        levels.append(10 * math.log10(energy / (FULL_SCALE * FULL_SCALE)) if energy else -math.inf)
+    return levels
+
+def pcm_duration(pcm: bytes, sample_rate: int) -> float:
+    return len(pcm) / SAMPLE_WIDTH / sample_rate
+
+def trim_silence(pcm: bytes, sample_rate: int, threshold_db: float = -40.0,
+                 frame_ms: int = 30, padding_ms: int = 200) -> bytes:
+    """
+    Cuts leading and trailing frames quieter than threshold_db, keeping
+    padding_ms of context on each side. Audio that never crosses the
+    threshold is returned unchanged, since a quiet microphone is more likely
+    than a message of pure silence.
+    """
+    levels = frame_levels(pcm, sample_rate, frame_ms)
+    voiced = [i for i, level in enumerate(levels) if level >= threshold_db]
+    if not voiced:
+        return pcm
+
+    frame_bytes = max(1, sample_rate * frame_ms // 1000) * SAMPLE_WIDTH
+    padding_bytes = sample_rate * padding_ms // 1000 * SAMPLE_WIDTH
+    start = max(0, voiced[0] * frame_bytes - padding_bytes)
+    end = min(len(pcm), (voiced[-1] + 1) * frame_bytes + padding_bytes)
+    return pcm[start:end]
+
+def split_at_pauses(pcm: bytes, sample_rate: int, chunk_seconds: float = 30.0, overlap_seconds: float = 1.0,
+                    frame_ms: int = 30, search_seconds: float = 5.0) -> list:
+    """
+    Splits PCM into chunks of at most about chunk_seconds. Each cut is placed
+    at the quietest frame within search_seconds before the nominal boundary,
+    which is normally a pause between words, and every chunk is extended by
+    overlap_seconds on both sides so a word clipped at a cut still appears
+    whole in one of its neighbours.
+    """
+    levels = frame_levels(pcm, sample_rate, frame_ms)
+    frame_bytes = max(1, sample_rate * frame_ms // 1000) * SAMPLE_WIDTH
+    frames_per_chunk = max(1, int(chunk_seconds * 1000 / frame_ms))
+    search_frames = int(search_seconds * 1000 / frame_ms)
+
+    cuts = [0]
+    # Don't leave a tail shorter than a quarter chunk
+    while len(levels) - cuts[-1] > frames_per_chunk + frames_per_chunk // 4:
+        nominal = cuts[-1] + frames_per_chunk
+        # Walk back from the nominal boundary so ties favour longer chunks
+        window = range(nominal, max(cuts[-1], nominal - search_frames), -1)
+        cuts.append(min(window, key=lambda i: levels[i]))
+    cuts.append(len(levels))
+
+    overlap_bytes = int(sample_rate * overlap_seconds) * SAMPLE_WIDTH
+    return [
+        pcm[max(0, start * frame_bytes - overlap_bytes):min(len(pcm), end * frame_bytes + overlap_bytes)]
+        for start, end in zip(cuts, cuts[1:])
+    ]
@@ -0,0 +1,199 @@
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from src.config import BOT_CONFIG
+from src.database import get_db
+
+class StateBackend(ABC):
+    """
+    Key-value store for runtime state (personas, bot mode, FSM, rate limits).
+    'shared' tells callers whether other bot replicas see the same data.
+    """
+    shared = False
+
+    @abstractmethod
+    async def get(self, key, default=None):
+        ...
+
+    @abstractmethod
+    async def set(self, key, value, ttl: float = None):
+        ...
+
+    @abstractmethod
+    async def setdefault(self, key, value, ttl: float = None):
+        """Stores value only if key is absent and returns whatever is stored."""
+
+    @abstractmethod
+    async def delete(self, key):
+        ...
+
+    @abstractmethod
+    async def incr(self, key, amount: int = 1, ttl: float = None):
+        """Atomically adds amount and returns the new value. ttl applies when the key is created."""
+
+    async def setup(self):
+        pass
+
+    async def close(self):
+        pass
+
+class MemoryStateBackend(StateBackend):
+    """Per-process state. Expired keys are dropped lazily and by a periodic sweep."""
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._data = {}
+        self._writes = 0
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and time.monotonic() >= entry[0]:
+            del self._data[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            now = time.monotonic()
+            for k in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and now >= expires_at]:
+                del self._data[k]
+
+    async def get(self, key, default=None):
+        entry = self._alive(key)
+        return default if entry is None else entry[1]
+
+    async def set(self, key, value, ttl: float = None):
+        self._store(key, value, ttl)
+
+    async def setdefault(self, key, value, ttl: float = None):
+        entry = self._alive(key)
+        if entry is not None:
+            return entry[1]
+        self._store(key, value, ttl)
+        return value
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def incr(self, key, amount: int = 1, ttl: float = None):
+        entry = self._alive(key)
+        if entry is None:
+            self._store(key, amount, ttl)
+            return amount
+        value = entry[1] + amount
+        self._data[key] = (entry[0], value)
+        return value
+
+class MongoStateBackend(StateBackend):
+    """
+    State shared by all replicas in the 'state' collection ({_id: key, value, expires_at}).
+    A TTL index removes expired documents; reads also check expires_at because
+    the TTL monitor only runs about once a minute.
+    """
+    shared = True
+
+    def _collection(self):
+        return get_db()["state"]
+
+    @staticmethod
+    def _expires_at(ttl):
+        return datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _live_filter(key):
+        return {"_id": key, "$or": [{"expires_at": None}, {"expires_at": {"$gt": datetime.now(timezone.utc)}}]}
+
+    async def setup(self):
+        await self._collection().create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key, default=None):
+        doc = await self._collection().find_one(self._live_filter(key))
+        return default if doc is None else doc["value"]
+
+    async def set(self, key, value, ttl: float = None):
+        await self._collection().update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": self._expires_at(ttl)}},
+            upsert=True
+        )
+
+    async def setdefault(self, key, value, ttl: float = None):
+        # Replace an expired leftover first so it isn't returned as current
+        await self._collection().delete_one({"_id": key, "expires_at": {"$lte": datetime.now(timezone.utc)}})
+        try:
+            doc = await self._collection().find_one_and_update(
+                {"_id": key},
+                {"$setOnInsert": {"value": value, "expires_at": self._expires_at(ttl)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another replica inserted it between our lookup and upsert
+            doc = await self._collection().find_one({"_id": key})
+        return doc["value"]
+
+    async def delete(self, key):
+        await self._collection().delete_one({"_id": key})
+
+    async def incr(self, key, amount: int = 1, ttl: float = None):
+        update = {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expires_at(ttl)}}
+        try:
+            doc = await self._collection().find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Concurrent upsert from another replica; the document exists now
+            doc = await self._collection().find_one_and_update(
+                {"_id": key}, update, return_document=ReturnDocument.AFTER
+            )
+        return doc["value"]
+
+class BackendFSMStorage(BaseStorage):
+    """aiogram FSM storage on top of a StateBackend, so FSM state follows the backend."""
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(key: StorageKey, part: str):
+        return f"fsm:{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.business_connection_id}:{key.destiny}:{part}"
+
+    async def set_state(self, key: StorageKey, state=None):
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.backend.delete(self._key(key, "state"))
+        else:
+            await self.backend.set(self._key(key, "state"), state)
+
+    async def get_state(self, key: StorageKey):
+        return await self.backend.get(self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data):
+        if data:
+            await self.backend.set(self._key(key, "data"), dict(data))
+        else:
+            await self.backend.delete(self._key(key, "data"))
+
+    async def get_data(self, key: StorageKey):
+        return dict(await self.backend.get(self._key(key, "data"), {}))
+
+    async def close(self):
+        pass
+
+def create_state_backend():
+    backend = BOT_CONFIG.get("state", {}).get("backend", "memory")
+    if backend == "mongo":
+        return MongoStateBackend()
+    if backend != "memory":
+        print(f"Unknown state backend '{backend}', using memory")
+    return MemoryStateBackend()
+
+# Process-wide backend selected by bot_config.yaml -> state.backend
+state_backend = create_state_backend()
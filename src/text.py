@@ -0,0 +1,86 @@
+import re
+
+# Emoji and pictographs as code point ranges: symbols & pictographs, dingbats,
+# misc symbols, arrows/technical symbols used as emoji, regional indicators,
+# plus the joiners and selectors that glue sequences together.
+EMOJI_CLASS = (
+    "\U0001F000-\U0001FAFF"
+    "\u2600-\u27BF"
+    "\u2300-\u23FF"
+    "\u2B00-\u2BFF"
+    "\u2190-\u21FF"
+    "\u2934\u2935\u3030\u303D\u3297\u3299"
+    "\u00A9\u00AE\u203C\u2049\u2122\u2139\u24C2\u25AA-\u25FE"
+    "\u200D\uFE0F\u20E3"
+    "\U000E0020-\U000E007F"
+)
+EMOJI_RE = re.compile(f"[{EMOJI_CLASS}]+")
+
+MARKDOWN_CHARS = str.maketrans("", "", "*_`[]")
+
+# One alternation for everything either output needs to change. Branch order
+# matters: fences before inline code, list markers before bare '*'.
+_TOKEN_RE = re.compile(
+    r"(?P<fence>```[\s\S]*?```)"
+    r"|(?P<code>`[^`]+`)"
+    r"|(?P<link>\[(?P<label>[^\]]+)\]\((?P<url>[^)]+)\))"
+    r"|(?P<item>^[ \t]*(?:[-*]|\d+\.)[ \t]+)"
+    r"|(?P<header>#+[ \t]?)"
+    r"|(?P<mark>[*_`\[\]]+)"
+    rf"|(?P<emoji>[{EMOJI_CLASS}]+)",
+    re.MULTILINE
+)
+
+def sanitize_reply(text: str) -> tuple:
+    """
+    Cleans an LLM reply for both outputs in one scan.
+    Returns (plain, tts):
+      - plain: Telegram-safe text with Markdown syntax characters (* _ ` [ ]) removed
+      - tts: text for speech, additionally without emoji, code blocks,
+        link targets, headers and list markers
+    """
+    if not text:
+        return "", ""
+
+    plain = []
+    tts = []
+    pos = 0
+    for match in _TOKEN_RE.finditer(text):
+        start = match.start()
+        if start > pos:
+            chunk = text[pos:start]
+            plain.append(chunk)
+            tts.append(chunk)
+        pos = match.end()
+
+        kind = match.lastgroup
+        token = match.group()
+        if kind == "mark":
+            continue
+        if kind == "emoji" or kind == "header":
+            plain.append(token)
+        elif kind == "item":
+            plain.append(token.replace("*", ""))
+        elif kind == "code":
+            code = token.translate(MARKDOWN_CHARS)
+            plain.append(code)
+            tts.append(code)
+        elif kind == "fence":
+            plain.append(token.translate(MARKDOWN_CHARS))
+        elif kind == "link":
+            label = match.group("label").translate(MARKDOWN_CHARS)
+            plain.append(f"{label}({match.group('url').translate(MARKDOWN_CHARS)})")
+            tts.append(EMOJI_RE.sub("", label))
+
+    if pos < len(text):
+        plain.append(text[pos:])
+        tts.append(text[pos:])
+    return "".join(plain), "".join(tts).strip()
+
+def strip_markdown(text: str) -> str:
+    """Removes Markdown syntax characters (*, _, `, [, ]) to prevent rendering issues."""
+    return text.translate(MARKDOWN_CHARS)
+
+def clean_markdown_for_tts(text: str) -> str:
+    """Removes Markdown formatting and emoji, keeping only the human-readable content for TTS."""
+    return sanitize_reply(text)[1]
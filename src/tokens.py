@@ -0,0 +1,51 @@
+import re
+from functools import lru_cache
+
+# Offline token estimation for chat prompts. We don't ship the provider's
+# tokenizer, so we approximate BPE behaviour: every word or punctuation mark
+# is at least one token, long ASCII words split roughly every 4 characters
+# and Cyrillic/other scripts roughly every 3. This errs on the high side,
+# which is what a budget needs.
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Role and separator tokens added by the chat template for every message
+MESSAGE_OVERHEAD = 4
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    total = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isascii():
+            total += 1 + (len(piece) - 1) // 4
+        else:
+            total += 1 + (len(piece) - 1) // 3
+    return total
+
+def message_tokens(message: dict) -> int:
+    return MESSAGE_OVERHEAD + estimate_tokens(message.get("content") or "")
+
+def trim_history(history: list, budget: int, min_messages: int = 1) -> list:
+    """
+    Returns the newest part of history that fits in budget tokens.
+    Leading system messages (e.g. the verified contact note) are always kept,
+    as are the last min_messages messages even if they exceed the budget.
+    """
+    pinned = []
+    for message in history:
+        if message.get("role") != "system":
+            break
+        pinned.append(message)
+    rest = history[len(pinned):]
+
+    remaining = budget - sum(message_tokens(m) for m in pinned)
+    kept = 0
+    for i, message in enumerate(reversed(rest)):
+        cost = message_tokens(message)
+        if i >= min_messages and cost > remaining:
+            break
+        remaining -= cost
+        kept += 1
+
+    return pinned + rest[len(rest) - kept:]
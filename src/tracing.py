@@ -0,0 +1,210 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import secrets
+import time
+from contextvars import ContextVar
+from src.config import BOT_CONFIG
+
+TRACING_CONFIG = BOT_CONFIG.get("tracing", {})
+
+# Innermost open span of the running task; asyncio tasks inherit it when created
+_current = ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "trace")
+
+    def __init__(self, name, trace, attrs, start=None):
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin):
+        """JSON-ready tree; times in ms, 'at' relative to the trace start."""
+        node = {"name": self.name, "at": round((self.start - origin) * 1000, 2), "ms": round(self.duration * 1000, 2)}
+        if self.attrs:
+            node["attrs"] = self.attrs
+        if self.children:
+            # Spans added by record() come in after the ones they overlap
+            node["children"] = [child.to_dict(origin) for child in sorted(self.children, key=lambda c: c.start)]
+        return node
+
+class Trace:
+    __slots__ = ("trace_id", "root", "spans", "dropped", "max_spans")
+
+    def __init__(self, max_spans):
+        self.trace_id = secrets.token_hex(8)
+        self.root = None
+        self.spans = 0
+        self.dropped = 0
+        self.max_spans = max_spans
+
+    def add(self, parent, name, attrs, start=None):
+        """New child of parent, or None once the span budget of this trace is spent."""
+        if self.spans >= self.max_spans:
+            self.dropped += 1
+            return None
+        self.spans += 1
+        child = Span(name, self, attrs, start)
+        parent.children.append(child)
+        return child
+
+class span:
+    """
+    Records a with-block as a child of the current span:
+        with span("stt", chunks=3):
+            ...
+    A no-op outside a trace, so it is safe to leave in library code.
+    """
+    __slots__ = ("_name", "_attrs", "_span", "_token")
+
+    def __init__(self, name, **attrs):
+        self._name = name
+        self._attrs = attrs
+        self._span = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None and parent.end is None:
+            self._span = parent.trace.add(parent, self._name, self._attrs)
+            if self._span is not None:
+                self._token = _current.set(self._span)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            self._span.end = time.perf_counter()
+            if exc_type is not None:
+                self._span.attrs["error"] = exc_type.__name__
+            _current.reset(self._token)
+        return False
+
+class trace(span):
+    """
+    Starts a new trace unless one is already open, in which case it is just a
+    span. Work that outlives the trace it was started from (e.g. a coalesced
+    turn running after its update returned) gets a trace of its own, linked by
+    'parent_trace'. Slow traces are logged as one JSON line.
+    """
+    __slots__ = ("_root",)
+
+    def __enter__(self):
+        parent = _current.get()
+        self._root = False
+        if parent is not None and parent.end is None:
+            return super().__enter__()
+        if not TRACING_CONFIG.get("enabled", True):
+            return self
+        if parent is not None:
+            self._attrs["parent_trace"] = parent.trace.trace_id
+        new_trace = Trace(TRACING_CONFIG.get("max_spans", 256))
+        self._span = new_trace.root = Span(self._name, new_trace, self._attrs)
+        self._token = _current.set(self._span)
+        self._root = True
+        return self
+
+    @property
+    def trace_id(self):
+        return self._span.trace.trace_id if self._span is not None else None
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if self._root and self._span.duration >= TRACING_CONFIG.get("slow_threshold", 5.0):
+            log_trace(self._span.trace)
+        return False
+
+def record(name, start, **attrs):
+    """Adds an already finished span (started at perf_counter() 'start', ending now) to the current trace."""
+    parent = _current.get()
+    if parent is not None and parent.end is None:
+        finished = parent.trace.add(parent, name, attrs, start)
+        if finished is not None:
+            finished.end = time.perf_counter()
+
+def log_trace(trace_obj):
+    root = trace_obj.root
+    entry = {"trace_id": trace_obj.trace_id, **root.to_dict(root.start)}
+    if trace_obj.dropped:
+        entry["dropped_spans"] = trace_obj.dropped
+    logging.warning(f"Slow {root.name} ({root.duration:.2f}s): {json.dumps(entry, ensure_ascii=False, default=str)}")
+
+# Selector waits are the event loop idling, not work
+_IDLE_FUNCTIONS = ("<method 'poll' of 'select.epoll' objects>", "<method 'select' of 'select.poll' objects>",
+                   "<method 'control' of 'select.kqueue' objects>", "<built-in method select.select>")
+
+class Profiler:
+    """
+    cProfile over the event loop thread for the next N updates, switched on
+    from chat. Everything running meanwhile is profiled (overlapping updates,
+    coalesced turns, background flushes); worker threads are not.
+    """
+    def __init__(self, top: int = None, sort: str = None):
+        self.top = top or TRACING_CONFIG.get("profile_top", 15)
+        self.sort = sort or TRACING_CONFIG.get("profile_sort", "tottime")
+        self.chat_id = None
+        self.remaining = 0
+        self.updates = 0
+        self._profile = None
+        self._started_at = 0.0
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start(self, updates: int, chat_id):
+        """
+        Raises ValueError if profiling is already running (stop() it first,
+        so its report isn't lost) or another profiler is hooked into the interpreter.
+        """
+        if self._profile is not None:
+            raise ValueError(f"profiling is already running, {self.remaining} updates left")
+        profile = cProfile.Profile()
+        profile.enable()
+        self._profile = profile
+        self.chat_id = chat_id
+        self.remaining = self.updates = updates
+        self._started_at = time.monotonic()
+
+    def update_done(self):
+        """Counts one profiled update. Returns the report when it was the last one, else None."""
+        if self._profile is None:
+            return None
+        self.remaining -= 1
+        if self.remaining > 0:
+            return None
+        return self.stop()
+
+    def stop(self) -> str:
+        """Stops profiling and returns the hot functions as text."""
+        profile, self._profile = self._profile, None
+        profile.disable()
+        elapsed = time.monotonic() - self._started_at
+        profiled = self.updates - max(self.remaining, 0)
+        return self._format(pstats.Stats(profile), profiled, elapsed)
+
+    def _format(self, stats, profiled, elapsed):
+        # (file, line, function) -> (primitive calls, calls, self time, cumulative time, callers)
+        index = {"tottime": 2, "cumtime": 3, "ncalls": 1}.get(self.sort, 2)
+        entries = [(func, row) for func, row in stats.stats.items() if func[2] not in _IDLE_FUNCTIONS]
+        entries.sort(key=lambda item: item[1][index], reverse=True)
+
+        lines = [
+            f"🔬 Профиль: {profiled} обновл., {elapsed:.1f} с, {stats.total_calls} вызовов",
+            f"Топ-{self.top} по {self.sort} (self мс / всего мс / вызовы):",
+        ]
+        for (filename, line, name), (_, calls, self_time, total_time, _) in entries[:self.top]:
+            location = f"{os.path.basename(filename)}:{line}" if filename != "~" else "builtin"
+            lines.append(f"{self_time * 1000:.1f} / {total_time * 1000:.1f} / {calls}  {name} ({location})")
+        # Telegram message limit
+        return "\n".join(lines)[:4000]
+
+profiler = Profiler()
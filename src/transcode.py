@@ -0,0 +1,125 @@
+import asyncio
+import time
+from src.config import LLM_CONFIG
+
+class TranscodeQueueFull(Exception):
+    """Raised when too many conversions are already waiting."""
+
+async def ffmpeg_pipe(data: bytes, input_format: str, *output_args: str, timeout: float = None,
+                      input_args: tuple = ()) -> bytes:
+    """
+    Transcodes bytes through ffmpeg's stdin/stdout, no files touched.
+    output_args must include the output format (e.g. "-f", "wav").
+    input_args describe headerless input (e.g. "-ar", "16000", "-ac", "1" for s16le).
+    The process is killed if it runs longer than timeout seconds.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        *input_args, "-f", input_format, "-i", "pipe:0",
+        *output_args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout)
+    except BaseException:
+        # Timeout or cancellation: don't leave ffmpeg running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({process.returncode}): {stderr.decode(errors='replace').strip()}")
+    return stdout
+
+class TranscodePool:
+    """
+    Bounded pool for audio conversion, shared by STT and TTS.
+    At most 'workers' jobs run at once and at most 'max_queue' wait for a
+    worker; beyond that callers get TranscodeQueueFull right away so they can
+    degrade (e.g. reply with text only) instead of piling up. Every job has
+    a timeout. Queue wait and run time are recorded per job label.
+    """
+    def __init__(self, workers: int = None, max_queue: int = None, timeout: float = None):
+        transcode_config = LLM_CONFIG.get("transcoding", {})
+        self.workers = workers if workers is not None else transcode_config.get("workers", 2)
+        self.max_queue = max_queue if max_queue is not None else transcode_config.get("max_queue", 16)
+        self.timeout = timeout if timeout is not None else transcode_config.get("timeout", 30)
+
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._waiting = 0
+        self._running = 0
+        self._metrics = {}
+
+    def _record(self, label, field, value=1):
+        metrics = self._metrics.setdefault(label, {
+            "jobs": 0, "failed": 0, "timeouts": 0, "rejected": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0,
+        })
+        if field in ("wait", "run"):
+            metrics[f"{field}_total"] += value
+            metrics[f"{field}_max"] = max(metrics[f"{field}_max"], value)
+        else:
+            metrics[field] += value
+
+    async def _submit(self, label, job):
+        if self._waiting >= self.max_queue:
+            self._record(label, "rejected")
+            raise TranscodeQueueFull(f"{self._waiting} conversions already waiting")
+
+        enqueued_at = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        started_at = time.monotonic()
+        self._record(label, "wait", started_at - enqueued_at)
+        self._running += 1
+        try:
+            result = await asyncio.wait_for(job(), self.timeout)
+            self._record(label, "jobs")
+            return result
+        except asyncio.TimeoutError:
+            self._record(label, "timeouts")
+            raise
+        except Exception:
+            self._record(label, "failed")
+            raise
+        finally:
+            self._running -= 1
+            self._record(label, "run", time.monotonic() - started_at)
+            self._semaphore.release()
+
+    async def convert(self, data: bytes, input_format: str, *output_args: str, label: str = "convert",
+                      input_args: tuple = ()) -> bytes:
+        """Runs one ffmpeg pipe conversion in the pool."""
+        return await self._submit(label, lambda: ffmpeg_pipe(data, input_format, *output_args, input_args=input_args))
+
+    async def run_in_thread(self, func, *args, label: str = "cpu"):
+        """
+        Runs CPU-bound audio work in a thread, bounded by the same pool.
+        On timeout the thread is abandoned (threads can't be killed), so keep these jobs short.
+        """
+        return await self._submit(label, lambda: asyncio.to_thread(func, *args))
+
+    def stats(self):
+        jobs = {}
+        for label, m in self._metrics.items():
+            completed = m["jobs"] + m["failed"] + m["timeouts"]
+            jobs[label] = {
+                "jobs": m["jobs"],
+                "failed": m["failed"],
+                "timeouts": m["timeouts"],
+                "rejected": m["rejected"],
+                "avg_wait": m["wait_total"] / completed if completed else 0.0,
+                "max_wait": m["wait_max"],
+                "avg_run": m["run_total"] / completed if completed else 0.0,
+                "max_run": m["run_max"],
+            }
+        return {"running": self._running, "waiting": self._waiting, "jobs": jobs}
+
+# One pool per process, shared by both audio directions
+transcode_pool = TranscodePool()
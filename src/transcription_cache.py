@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from src.cache import TTLCache
+from src.config import LLM_CONFIG
+from src.database import get_db
+from src.metrics import CACHE_LOOKUPS
+
+class TranscriptionCache:
+    """
+    Transcripts of voice notes keyed by Telegram's file_unique_id, which is
+    the same for forwarded and re-sent copies of a file. An in-memory LRU
+    sits in front of an optional 'transcriptions' collection
+    ({_id: file_unique_id, text, expires_at}) with a TTL index, so repeats
+    are recognized across restarts and replicas.
+    """
+    def __init__(self, enabled: bool = None, max_entries: int = None, ttl: float = None, persist: bool = None):
+        cache_config = LLM_CONFIG.get("stt", {}).get("cache", {})
+        self.enabled = enabled if enabled is not None else cache_config.get("enabled", True)
+        self.ttl = ttl if ttl is not None else cache_config.get("ttl", 7 * 24 * 3600)
+        self.persist = persist if persist is not None else cache_config.get("persist", True)
+        self._cache = TTLCache(
+            max_entries=max_entries if max_entries is not None else cache_config.get("max_entries", 2048),
+            ttl=self.ttl
+        )
+        # Counted here rather than by the LRU, which can't see database hits
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _collection(self):
+        return get_db()["transcriptions"]
+
+    async def setup(self):
+        if self.enabled and self.persist:
+            await self._collection().create_index("expires_at", expireAfterSeconds=0)
+
+    def _count(self, result):
+        CACHE_LOOKUPS.labels(cache="transcription", result=result).inc()
+
+    async def get(self, file_unique_id):
+        if not self.enabled:
+            return None
+        text = self._cache.get(file_unique_id)
+        if text is not None:
+            self.hits += 1
+            self._count("hit")
+            return text
+        if not self.persist:
+            self.misses += 1
+            self._count("miss")
+            return None
+
+        try:
+            doc = await self._collection().find_one(
+                {"_id": file_unique_id, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            print(f"Transcription cache lookup failed: {e}")
+            self.misses += 1
+            self._count("miss")
+            return None
+        if doc is None:
+            self.misses += 1
+            self._count("miss")
+            return None
+
+        self.hits += 1
+        self.db_hits += 1
+        self._count("db_hit")
+        self._cache.set(file_unique_id, doc["text"])
+        return doc["text"]
+
+    async def put(self, file_unique_id, text):
+        if not self.enabled or not text:
+            return
+        self._cache.set(file_unique_id, text)
+        if not self.persist:
+            return
+        try:
+            await self._collection().update_one(
+                {"_id": file_unique_id},
+                {"$set": {"text": text, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Transcription cache write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
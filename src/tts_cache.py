@@ -0,0 +1,160 @@
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from src.config import LLM_CONFIG
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized voice replies.
+    The key is a hash of (clean text, voice, rate, pitch). Encoded Opus bytes
+    are stored as <key>.ogg in 'directory' under an LRU byte budget, and the
+    Telegram file_id of an uploaded reply is kept in <key>.fid so a repeat is
+    sent by id without re-uploading.
+    File reads and writes on the reply path run in worker threads; the index
+    itself is only touched from the event loop.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = None, enabled: bool = None):
+        cache_config = LLM_CONFIG.get("tts", {}).get("cache", {})
+        self.enabled = enabled if enabled is not None else cache_config.get("enabled", True)
+        self.directory = directory if directory is not None else cache_config.get("directory", os.path.join("cache", "tts"))
+        self.max_bytes = max_bytes if max_bytes is not None else cache_config.get("max_bytes", 100 * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self.file_id_hits = 0
+
+        # key -> size in bytes, least recently used first
+        self._index = OrderedDict()
+        self._file_ids = {}
+        self._size = 0
+        if self.enabled:
+            self._load_index()
+
+    @staticmethod
+    def make_key(text, voice, rate, pitch):
+        return hashlib.sha256("\x1f".join((text, voice, rate, pitch)).encode("utf-8")).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _load_index(self):
+        """
+        Rebuilds the LRU order from files on disk, oldest write first. Hits
+        only reorder the in-memory index, so recency is lost across restarts.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".tmp"):
+                    # Left over from a write interrupted by a crash
+                    os.remove(os.path.join(self.directory, name))
+                elif name.endswith(".ogg"):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._index[key] = size
+                self._size += size
+                fid_path = self._path(key, "fid")
+                if os.path.exists(fid_path):
+                    with open(fid_path, "r", encoding="utf-8") as f:
+                        self._file_ids[key] = f.read().strip()
+        except Exception as e:
+            print(f"TTS cache disabled, cannot use {self.directory}: {e}")
+            self.enabled = False
+
+    def _touch(self, key):
+        self._index.move_to_end(key)
+
+    def _remove(self, key):
+        """Drops key from the index; returns the paths to delete."""
+        self._size -= self._index.pop(key, 0)
+        self._file_ids.pop(key, None)
+        return [self._path(key, "ogg"), self._path(key, "fid")]
+
+    @staticmethod
+    def _delete_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write(path, data: bytes):
+        # Write then rename, so a concurrent read never sees a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_file_id(self, key):
+        if not self.enabled or key not in self._index:
+            return None
+        file_id = self._file_ids.get(key)
+        if file_id:
+            self.file_id_hits += 1
+            self._touch(key)
+        return file_id
+
+    async def get(self, key):
+        if not self.enabled or key not in self._index:
+            self.misses += 1
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, self._path(key, "ogg"))
+        except OSError:
+            await asyncio.to_thread(self._delete_files, self._remove(key))
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(key)
+        return data
+
+    async def put(self, key, data: bytes):
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write, self._path(key, "ogg"), data)
+        except OSError as e:
+            print(f"TTS cache write failed: {e}")
+            return
+        self._size += len(data) - self._index.get(key, 0)
+        self._index[key] = len(data)
+        self._index.move_to_end(key)
+        evicted = []
+        while self._size > self.max_bytes and len(self._index) > 1:
+            evicted.extend(self._remove(next(iter(self._index))))
+        if evicted:
+            await asyncio.to_thread(self._delete_files, evicted)
+
+    async def set_file_id(self, key, file_id):
+        if not self.enabled or key not in self._index:
+            return
+        self._file_ids[key] = file_id
+        try:
+            await asyncio.to_thread(self._write, self._path(key, "fid"), file_id.encode("utf-8"))
+        except OSError as e:
+            print(f"TTS cache write failed: {e}")
+
+    async def forget_file_id(self, key):
+        self._file_ids.pop(key, None)
+        await asyncio.to_thread(self._delete_files, [self._path(key, "fid")])
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.file_id_hits
+        return {
+            "entries": len(self._index),
+            "bytes": self._size,
+            "hits": self.hits,
+            "file_id_hits": self.file_id_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.file_id_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,289 @@
+"""
+Offline end-to-end benchmark. Drives the real router from src/handlers.py
+through aiogram's Dispatcher, with the production middlewares, against a
+local fake Bot API (tests/fake_telegram.py) and a local OpenAI-compatible
+stub (tests/fake_openai.py). Reports throughput, p50/p95/p99 handler
+latency and memory growth for text, voice and booking scenarios.
+
+Needs ffmpeg on PATH; no network or API keys. MongoDB is simulated in
+memory (tests/fake_mongo.py) unless --mongo is given, which uses the server
+at MONGO_URI. The bot's init_db() reseeds the services collection, so a real
+server is only used when the URI's database is bench_e2e (dropped at the end).
+
+    python tests/bench_e2e.py --users 50 --llm-latency 0.3 --token-rate 50
+    MONGO_URI=mongodb://localhost:27017/bench_e2e python tests/bench_e2e.py --mongo
+"""
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import shutil
+import sys
+import time
+
+# Manually add src to path to import modules
+sys.path.append(os.path.join(os.getcwd(), ''))
+sys.path.append(os.path.join(os.getcwd(), 'tests'))
+
+# Must be set before src modules read them; stand-in servers don't check keys
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/bench_e2e")
+os.environ.setdefault("GROQ_API_KEY", "fake")
+os.environ.setdefault("FAKE_API_KEY", "fake")
+os.environ.setdefault("ADMIN_GROUP_ID", "-100500")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from openai import AsyncOpenAI
+
+from src import handlers, database
+from src.bot import create_dispatcher
+from src.middleware import TelegramMetricsMiddleware
+from src.metrics import STAGE_SECONDS, TELEGRAM_SECONDS
+from src.config import BOT_CONFIG, LLM_CONFIG
+from src.database import init_db, get_db, get_client, close_db
+from src.llm import LLMClient
+from src.prompts import warm_prompt_cache
+from fake_mongo import FakeMongoClient
+from fake_openai import FakeOpenAIServer, DEFAULT_REPLY, DEFAULT_TRANSCRIPT
+from fake_telegram import FakeTelegramServer, BOT_USER
+from bench_voice_pipeline import make_sample
+
+BENCH_DATABASE = "bench_e2e"
+BOOKING_REQUEST = "Хочу записаться на разработку бота"
+BOOKING_REPLY = (
+    "Отлично, оформляю заявку!\n```json\n"
+    '{"booking_confirmed": true, "name": "Иван", "service": "Telegram-бот", '
+    '"topic": "Бот для записи клиентов", "contact": "+79990000000"}\n```'
+)
+QUESTIONS = ["Сколько стоит бот?", "Какие сроки разработки?", "Что входит в поддержку?"]
+
+def llm_reply(messages):
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return BOOKING_REPLY if BOOKING_REQUEST in last else DEFAULT_REPLY
+
+def rss_mb():
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(q / 100 * (len(sorted_values) - 1)))]
+
+class Harness:
+    """Feeds raw updates into the dispatcher and times each one."""
+    def __init__(self, bot, dp):
+        self.bot = bot
+        self.dp = dp
+        self.latencies = []
+        self.errors = 0
+        self.first_error = None
+        self._update_id = 0
+
+    @staticmethod
+    def user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message(self, user_id, **fields):
+        return {
+            "message": {
+                "message_id": self._update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self.user(user_id),
+                **fields,
+            }
+        }
+
+    async def feed(self, raw):
+        self._update_id += 1
+        raw["update_id"] = self._update_id
+        update = Update.model_validate(raw, context={"bot": self.bot})
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            self.first_error = self.first_error or repr(e)
+        self.latencies.append(time.perf_counter() - start)
+
+# --- Scenarios: one coroutine per virtual user ---
+
+async def text_user(h, telegram, user_id, args):
+    for i in range(args.messages):
+        await h.feed(h.message(user_id, text=QUESTIONS[i % len(QUESTIONS)]))
+
+async def voice_user(h, telegram, user_id, args):
+    file_id = f"voice-{user_id}"
+    await h.feed(h.message(user_id, voice={
+        "file_id": file_id, "file_unique_id": file_id, "duration": int(args.voice_seconds), "mime_type": "audio/ogg"
+    }))
+
+async def booking_user(h, telegram, user_id, args):
+    await h.feed(h.message(user_id, text=BOOKING_REQUEST))
+    cards = [m for m in telegram.messages_to(user_id, "sendMessage") if "reply_markup" in m]
+    if not cards:
+        return
+    await h.feed({
+        "callback_query": {
+            "id": str(user_id),
+            "from": h.user(user_id),
+            "chat_instance": "bench",
+            "data": "approve_application",
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": cards[-1]["text"],
+            },
+        }
+    })
+
+def scenario_check(name, telegram, user_ids):
+    """What the bot actually sent, to catch a fast but broken run."""
+    if name == "voice":
+        voices = sum(len(telegram.messages_to(uid, "sendVoice")) for uid in user_ids)
+        return f"voice replies {voices}/{len(user_ids)}"
+    if name == "booking":
+        admin = len(telegram.messages_to(os.environ["ADMIN_GROUP_ID"], "sendMessage"))
+        return f"applications {admin}/{len(user_ids)}"
+    limited_reply = BOT_CONFIG.get("rate_limit", {}).get("reply")
+    limited = sum(1 for uid in user_ids for m in telegram.messages_to(uid, "sendMessage") if m.get("text") == limited_reply)
+    return f"rate-limited {limited}"
+
+SCENARIOS = {"text": text_user, "voice": voice_user, "booking": booking_user}
+
+async def run_scenario(name, h, telegram, args, first_user_id):
+    user_ids = list(range(first_user_id, first_user_id + args.users))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_user(user_id):
+        async with semaphore:
+            await SCENARIOS[name](h, telegram, user_id, args)
+
+    h.latencies = []
+    h.errors = 0
+    gc.collect()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_user(uid) for uid in user_ids))
+    wall = time.perf_counter() - start
+    gc.collect()
+    rss_after = rss_mb()
+
+    latencies = sorted(h.latencies)
+    ms = [percentile(latencies, q) * 1000 for q in (50, 95, 99)]
+    print(
+        f"{name:<8} {len(latencies):>5} updates  {len(latencies) / wall:7.1f} upd/s  "
+        f"p50 {ms[0]:7.1f} ms  p95 {ms[1]:7.1f} ms  p99 {ms[2]:7.1f} ms  "
+        f"RSS {rss_after:6.1f} MB ({rss_after - rss_before:+.1f})  errors {h.errors}  {scenario_check(name, telegram, user_ids)}"
+    )
+
+async def run(args):
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg is not on PATH; it is needed for the voice pipeline.")
+        return
+    if not args.mongo:
+        database._client = FakeMongoClient(BENCH_DATABASE, latency=args.mongo_latency)
+    elif get_db().name != BENCH_DATABASE:
+        # init_db() wipes and reseeds services: never point it at a real catalog
+        print(f"Refusing to use database '{get_db().name}': --mongo needs a MONGO_URI ending in /{BENCH_DATABASE}.")
+        await close_db()
+        return
+    else:
+        try:
+            await get_db().command("ping")
+        except Exception as e:
+            print(f"MongoDB is not reachable at {database.MONGO_URI} ({e}).\nStart it with: docker compose up -d mongo")
+            await close_db()
+            return
+
+    voice_ogg = await make_sample(args.voice_seconds, "ogg", "libopus")
+    tts_mp3 = await make_sample(args.tts_seconds, "mp3", "libmp3lame")
+
+    openai = await FakeOpenAIServer(
+        latency=args.llm_latency, token_rate=args.token_rate, error_rate=args.error_rate,
+        reply=llm_reply, transcript=DEFAULT_TRANSCRIPT
+    ).start()
+    telegram = await FakeTelegramServer(latency=args.telegram_latency, voice_file=voice_ogg).start()
+
+    # Point the real clients at the stand-ins
+    config = dict(LLM_CONFIG)
+    config["providers"] = [{"name": "fake", "base_url": openai.base_url, "model": "fake-model",
+                            "api_key_env": "FAKE_API_KEY", "timeout": 30}]
+    config["hedging"] = {"enabled": False}
+    handlers.llm_client = LLMClient(config)
+    handlers.audio_client.client = AsyncOpenAI(base_url=openai.base_url, api_key="fake", max_retries=0)
+
+    # Edge-TTS needs the network: synthesis is replaced by a fixed MP3 after a delay
+    async def fake_synthesize_chunk(text, rate, pitch):
+        await asyncio.sleep(args.tts_latency)
+        return tts_mp3
+    handlers.audio_client._synthesize_chunk = fake_synthesize_chunk
+
+    # Measure the full pipeline every time
+    handlers.audio_client.tts_cache.enabled = False
+    handlers.transcription_cache.enabled = False
+    handlers.answer_cache.enabled = False
+    # Without the debounce window the dispatcher call covers the whole turn
+    handlers.coalescer.enabled = args.coalesce
+
+    await init_db()
+    warm_prompt_cache()
+    bot = Bot("123456:BENCH", session=AiohttpSession(api=TelegramAPIServer.from_base(telegram.base_url)))
+    bot.session.middleware(TelegramMetricsMiddleware())
+    dp, _ = create_dispatcher()
+    handlers.history_store.start()
+    h = Harness(bot, dp)
+
+    print(
+        f"--- E2E BENCHMARK ({args.users} users/scenario, concurrency {args.concurrency}, "
+        f"LLM latency {args.llm_latency}s @ {args.token_rate} tok/s, error rate {args.error_rate}) ---\n"
+    )
+    try:
+        for index, name in enumerate(args.scenarios):
+            await run_scenario(name, h, telegram, args, first_user_id=(index + 1) * 1_000_000)
+        if h.first_error:
+            print(f"\nFirst handler error: {h.first_error}")
+        print("\nMean time per stage (all scenarios):")
+        for histogram in (STAGE_SECONDS, TELEGRAM_SECONDS):
+            for (label,), (count, total) in sorted(histogram.totals().items()):
+                if count:
+                    print(f"  {label:<22} {total / count * 1000:8.1f} ms  x{count}")
+        print(f"\nTelegram calls: {dict(telegram.calls)}")
+        print(f"LLM/STT requests: {openai.requests} ({openai.errors} injected errors)")
+    finally:
+        await handlers.coalescer.wait_idle()
+        await handlers.history_store.stop()
+        await bot.session.close()
+        await telegram.stop()
+        await openai.stop()
+        if get_db().name == BENCH_DATABASE:
+            await get_client().drop_database(BENCH_DATABASE)
+        await close_db()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with fake Telegram and LLM servers")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=50, help="virtual users per scenario")
+    parser.add_argument("--concurrency", type=int, default=25, help="users active at once")
+    parser.add_argument("--messages", type=int, default=2, help="text messages per user")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--voice-seconds", type=float, default=5)
+    parser.add_argument("--tts-seconds", type=float, default=3)
+    parser.add_argument("--mongo", action="store_true", help=f"use the MongoDB at MONGO_URI (database must be {BENCH_DATABASE})")
+    parser.add_argument("--mongo-latency", type=float, default=0.001, help="round trip of the in-memory MongoDB")
+    parser.add_argument("--coalesce", action="store_true", help="keep the message coalescer on (latency then excludes the turn)")
+    asyncio.run(run(parser.parse_args()))
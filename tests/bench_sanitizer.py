@@ -0,0 +1,96 @@
+"""
+Compares the old reply clean-up chain (strip_markdown regex, then the emoji
+library plus ten re.sub passes for TTS) with the single-pass sanitize_reply
+used by the handlers. No network or API keys.
+
+    python tests/bench_sanitizer.py --replies 200 --runs 20
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+# Manually add src to path to import modules
+sys.path.append(os.path.join(os.getcwd(), ''))
+
+import emoji
+from src.text import sanitize_reply
+
+PARAGRAPHS = [
+    "## 🚀 Что мы предлагаем\n",
+    "Привет! 👋 Я помогу подобрать решение под вашу задачу. Расскажите, **что должен уметь бот**, и я назову сроки.",
+    "* **Базовый бот** — от 15 000 ₽ ✅\n* _Интеграция с CRM_ — от 25 000 ₽\n* **AI-ассистент** с памятью — от 40 000 ₽ 🤖",
+    "1. Анализ требований\n2. Прототип 👨‍💻\n3. Запуск и поддержка 🔧",
+    "Подробнее о кейсах: [портфолио](https://example.com/portfolio_2024) и [отзывы](https://example.com/reviews).",
+    "Для старта достаточно `python -m src.bot`, а конфиг лежит в `config/bot_config.yaml`.",
+    "```python\nasync def main():\n    await dp.start_polling(bot)\n```",
+    "Сроки зависят от объёма: обычно это 1–3 недели. 🇷🇺 Работаем по договору, оплата поэтапно ❤️",
+    "Если удобно, оставьте контакт — менеджер свяжется с вами в течение дня. 📞",
+]
+
+def make_replies(count, seed=7):
+    rng = random.Random(seed)
+    return ["\n\n".join(rng.choices(PARAGRAPHS, k=rng.randint(4, 12))) for _ in range(count)]
+
+# --- Old path: what the handlers / AudioClient did before ---
+
+def legacy_strip_markdown(text):
+    return re.sub(r"[\*\_`\[\]]", "", text)
+
+def legacy_clean_markdown_for_tts(text):
+    if not text:
+        return ""
+    text = emoji.replace_emoji(text, replace='')
+    text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)
+    text = re.sub(r'\*([^*]+)\*', r'\1', text)
+    text = re.sub(r'__([^_]+)__', r'\1', text)
+    text = re.sub(r'_([^_]+)_', r'\1', text)
+    text = re.sub(r'```[\s\S]*?```', '', text)
+    text = re.sub(r'`([^`]+)`', r'\1', text)
+    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    text = re.sub(r'#+\s?', '', text)
+    text = re.sub(r'^\s*[-*]\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
+    return text.strip()
+
+def legacy(reply):
+    plain = legacy_strip_markdown(reply)
+    return plain, legacy_clean_markdown_for_tts(plain)
+
+def measure(label, runs, replies, func):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for reply in replies:
+            func(reply)
+        timings.append((time.perf_counter() - start) * 1e6 / len(replies))
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<28} mean {statistics.mean(timings):8.1f} µs/reply   p95 {p95:8.1f} µs/reply")
+    return statistics.mean(timings)
+
+def run(args):
+    replies = make_replies(args.replies)
+    avg_chars = sum(map(len, replies)) // len(replies)
+    print(f"--- SANITIZER BENCHMARK ({args.replies} replies, ~{avg_chars} chars, {args.runs} runs) ---\n")
+
+    plain_mismatches = sum(1 for r in replies if sanitize_reply(r)[0] != legacy_strip_markdown(r))
+    print(f"Plain text identical to strip_markdown: {len(replies) - plain_mismatches}/{len(replies)}\n")
+
+    old = measure("Legacy chain (emoji + re.sub)", args.runs, replies, legacy)
+    new = measure("sanitize_reply (one pass)", args.runs, replies, sanitize_reply)
+    print(f"\nSpeedup: {old / new:.2f}x")
+
+    sample = replies[0]
+    print("\nSample TTS output (legacy / new):")
+    print(repr(legacy(sample)[1][:200]))
+    print(repr(sanitize_reply(sample)[1][:200]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Legacy vs single-pass reply sanitizer benchmark")
+    parser.add_argument("--replies", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=20)
+    run(parser.parse_args())
@@ -0,0 +1,99 @@
+"""
+Compares the old temp-file voice conversion path (pydub + files on disk)
+with the in-memory ffmpeg pipe path used by AudioClient.
+Needs ffmpeg on PATH; no network or API keys.
+
+    python tests/bench_voice_pipeline.py --seconds 15 --runs 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+# Manually add src to path to import modules
+sys.path.append(os.path.join(os.getcwd(), ''))
+
+from pydub import AudioSegment
+from src.transcode import ffmpeg_pipe
+
+async def make_sample(seconds, output_format, codec):
+    """Synthesizes a test tone in the given container, in memory."""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:a", codec, "-f", output_format, "pipe:1",
+        stdout=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await process.communicate()
+    return stdout
+
+# --- Old path: what handle_voice / AudioClient did before ---
+
+def legacy_stt(voice_bytes, workdir):
+    """Download to .oga, convert to .wav next to it, read it back for upload, clean up."""
+    base = os.path.join(workdir, f"voice_{uuid.uuid4().hex}")
+    with open(base + ".oga", "wb") as f:
+        f.write(voice_bytes)
+    AudioSegment.from_file(base + ".oga").export(base + ".wav", format="wav")
+    with open(base + ".wav", "rb") as f:
+        payload = f.read()
+    os.remove(base + ".wav")
+    os.remove(base + ".oga")
+    return payload
+
+def legacy_tts(mp3_bytes, workdir):
+    """Save Edge-TTS output as .mp3, convert to .ogg, read it back for upload, clean up."""
+    base = os.path.join(workdir, f"reply_{uuid.uuid4().hex}")
+    with open(base + ".mp3", "wb") as f:
+        f.write(mp3_bytes)
+    AudioSegment.from_mp3(base + ".mp3").export(base + ".ogg", format="ogg", codec="libopus")
+    os.remove(base + ".mp3")
+    with open(base + ".ogg", "rb") as f:
+        payload = f.read()
+    os.remove(base + ".ogg")
+    return payload
+
+# --- New path ---
+
+async def pipe_stt(voice_bytes):
+    return await ffmpeg_pipe(voice_bytes, "ogg", "-f", "wav")
+
+async def pipe_tts(mp3_bytes):
+    return await ffmpeg_pipe(mp3_bytes, "mp3", "-c:a", "libopus", "-f", "ogg")
+
+async def measure(label, runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            result = await result
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<28} mean {statistics.mean(timings):8.1f} ms   p95 {p95:8.1f} ms   output {len(result):>9} bytes")
+    return statistics.mean(timings)
+
+async def run(args):
+    print(f"--- VOICE PIPELINE BENCHMARK ({args.seconds}s audio, {args.runs} runs) ---\n")
+    voice = await make_sample(args.seconds, "ogg", "libopus")
+    mp3 = await make_sample(args.seconds, "mp3", "libmp3lame")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        old_stt = await measure("STT temp files (pydub)", args.runs, lambda: legacy_stt(voice, workdir))
+        new_stt = await measure("STT ffmpeg pipe", args.runs, lambda: pipe_stt(voice))
+        old_tts = await measure("TTS temp files (pydub)", args.runs, lambda: legacy_tts(mp3, workdir))
+        new_tts = await measure("TTS ffmpeg pipe", args.runs, lambda: pipe_tts(mp3))
+
+    print(f"\nSTT speedup: {old_stt / new_stt:.2f}x, TTS speedup: {old_tts / new_tts:.2f}x")
+    print("Note: the temp-file path also blocks the event loop for its whole duration.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Temp-file vs in-memory voice conversion benchmark")
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--runs", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
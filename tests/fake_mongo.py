@@ -0,0 +1,132 @@
+"""
+In-memory stand-in for the async pymongo client, covering the calls the bot
+makes (equality filters, $set/$push with $each/$slice, upserts). Lets the
+benchmarks run without a MongoDB server.
+
+Install it before the first get_db() call:
+    from src import database
+    database._client = FakeMongoClient("bench_e2e")
+"""
+import asyncio
+import copy
+import itertools
+from types import SimpleNamespace
+
+_ids = itertools.count(1)
+
+def _matches(doc, query):
+    return all(doc.get(key) == value for key, value in query.items())
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+class FakeCollection:
+    def __init__(self, latency):
+        self.latency = latency
+        self.docs = []
+
+    async def _roundtrip(self):
+        await asyncio.sleep(self.latency)
+
+    def _find(self, query):
+        return next((doc for doc in self.docs if _matches(doc, query)), None)
+
+    @staticmethod
+    def _apply(doc, update):
+        for key, value in update.get("$set", {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key, spec in update.get("$push", {}).items():
+            items = doc.setdefault(key, [])
+            if isinstance(spec, dict) and "$each" in spec:
+                items.extend(copy.deepcopy(spec["$each"]))
+                if "$slice" in spec:
+                    doc[key] = items[spec["$slice"]:] if spec["$slice"] < 0 else items[:spec["$slice"]]
+            else:
+                items.append(copy.deepcopy(spec))
+
+    async def find_one(self, query=None, *args, **kwargs):
+        await self._roundtrip()
+        doc = self._find(query or {})
+        return copy.deepcopy(doc) if doc else None
+
+    def find(self, query=None, *args, **kwargs):
+        return FakeCursor([copy.deepcopy(doc) for doc in self.docs if _matches(doc, query or {})])
+
+    async def insert_one(self, doc):
+        await self._roundtrip()
+        doc.setdefault("_id", next(_ids))
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs):
+        await self._roundtrip()
+        for doc in docs:
+            doc.setdefault("_id", next(_ids))
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    async def update_one(self, query, update, upsert=False):
+        await self._roundtrip()
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, upserted_id=None)
+            doc = {"_id": next(_ids), **copy.deepcopy(query)}
+            self.docs.append(doc)
+        self._apply(doc, update)
+        return SimpleNamespace(matched_count=1, upserted_id=doc["_id"])
+
+    async def delete_one(self, query):
+        await self._roundtrip()
+        doc = self._find(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        await self._roundtrip()
+        kept = [doc for doc in self.docs if not _matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+class FakeDatabase:
+    def __init__(self, name, latency):
+        self.name = name
+        self.latency = latency
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self.latency)
+        return self._collections[name]
+
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+class FakeMongoClient:
+    def __init__(self, database="bench_e2e", latency=0.0):
+        """latency: seconds added to every awaited call, like a network round trip"""
+        self._database = FakeDatabase(database, latency)
+
+    def get_database(self, name=None):
+        return self._database
+
+    async def drop_database(self, name):
+        self._database._collections.clear()
+
+    async def close(self):
+        pass
@@ -0,0 +1,168 @@
+"""
+Local OpenAI-compatible stand-in server for exercising LLMClient without a
+real provider or transcription endpoint. Latency, token rate and error
+injection are configurable.
+
+Run standalone:
+    python tests/fake_openai.py --port 8081 --latency 0.5 --error-rate 0.2
+and point a provider's base_url at http://127.0.0.1:8081/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+DEFAULT_REPLY = "Здравствуйте! Я тестовый ответ от локального сервера. Чем могу помочь?"
+DEFAULT_TRANSCRIPT = "Здравствуйте, сколько стоит разработка бота?"
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_rate=50.0,
+                 error_rate=0.0, error_status=503, retry_after=None, reply=DEFAULT_REPLY,
+                 transcript=DEFAULT_TRANSCRIPT, stt_seconds_per_mb=0.0):
+        """
+        latency: seconds before the first byte of every response
+        token_rate: streamed tokens per second (0 = as fast as possible)
+        error_rate: share of requests answered with error_status
+        retry_after: value of the Retry-After header on injected errors
+        reply: response text, or a callable taking the request messages
+        transcript: transcription text, or a callable taking (filename, audio bytes)
+        stt_seconds_per_mb: extra transcription latency proportional to upload size
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.reply = reply
+        self.transcript = transcript
+        self.stt_seconds_per_mb = stt_seconds_per_mb
+
+        self.requests = 0
+        self.errors = 0
+        self._runner = None
+
+        # Voice uploads are larger than aiohttp's 1 MB default
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post("/v1/chat/completions", self.handle_chat)
+        self.app.router.add_post("/v1/audio/transcriptions", self.handle_transcription)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the real port when an ephemeral one (0) was requested
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _inject(self):
+        """Applies latency and returns an error response if this request should fail."""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else None
+            return web.json_response(
+                {"error": {"message": "Injected failure", "type": "server_error"}},
+                status=self.error_status,
+                headers=headers
+            )
+        return None
+
+    def _reply_text(self, messages):
+        return self.reply(messages) if callable(self.reply) else self.reply
+
+    async def handle_chat(self, request):
+        body = await request.json()
+        error = await self._inject()
+        if error is not None:
+            return error
+
+        text = self._reply_text(body.get("messages", []))
+        model = body.get("model", "fake-model")
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        # Split on spaces but keep them, roughly one token per word
+        tokens = [t + " " for t in text.split(" ")]
+        tokens[-1] = tokens[-1][:-1]
+        for token in tokens:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if self.token_rate:
+                await asyncio.sleep(1 / self.token_rate)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_transcription(self, request):
+        form = await request.post()
+        upload = form["file"]
+        audio = upload.file.read()
+        error = await self._inject()
+        if error is not None:
+            return error
+
+        if self.stt_seconds_per_mb:
+            await asyncio.sleep(len(audio) / (1024 * 1024) * self.stt_seconds_per_mb)
+        text = self.transcript(upload.filename, audio) if callable(self.transcript) else self.transcript
+        return web.json_response({"text": text})
+
+async def _serve(args):
+    server = FakeOpenAIServer(
+        host=args.host, port=args.port, latency=args.latency, token_rate=args.token_rate,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+        stt_seconds_per_mb=args.stt_seconds_per_mb
+    )
+    await server.start()
+    print(f"Fake OpenAI server listening on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--stt-seconds-per-mb", type=float, default=0.0)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
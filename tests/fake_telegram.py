@@ -0,0 +1,131 @@
+"""
+Local stand-in for the Telegram Bot API, enough to drive the bot's handlers
+offline. Every call is recorded; latency is configurable.
+
+Point aiogram at it with:
+    Bot(token, session=AiohttpSession(api=TelegramAPIServer.from_base(server.base_url)))
+
+Run standalone:
+    python tests/fake_telegram.py --port 8082 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from aiohttp import web
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "Fake Bot", "username": "fake_bot"}
+
+class FakeTelegramServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, voice_file=b""):
+        """
+        latency: seconds before every API response
+        voice_file: bytes served for every downloaded file (voice notes)
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.voice_file = voice_file
+
+        self.calls = Counter()
+        # (method, params) of every call that sends or changes a message
+        self.sent = []
+        self._message_id = 0
+        self._runner = None
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the real port when an ephemeral one (0) was requested
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def messages_to(self, chat_id, method=None):
+        return [params for m, params in self.sent
+                if str(params.get("chat_id")) == str(chat_id) and (method is None or m == method)]
+
+    def _message(self, params, **fields):
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params["chat_id"]), "type": "private"},
+            "from": BOT_USER,
+        }
+        if "reply_markup" in params:
+            message["reply_markup"] = json.loads(params["reply_markup"])
+        message.update(fields)
+        return message
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self.sent.append((method, params))
+            message = self._message(params, text=params.get("text", ""))
+            if method == "editMessageText":
+                message["message_id"] = int(params["message_id"])
+            return message
+        if method == "sendVoice":
+            self.sent.append((method, params))
+            file_id = f"voice-{self._message_id + 1}"
+            return self._message(params, voice={"file_id": file_id, "file_unique_id": file_id, "duration": 1})
+        if method == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.voice_file),
+                    "file_path": f"voice/{file_id}.oga"}
+        if method == "deleteMessage":
+            self.sent.append((method, params))
+        # sendChatAction, answerCallbackQuery, deleteMessage, deleteWebhook, ...
+        return True
+
+    async def handle_method(self, request):
+        method = request.match_info["method"]
+        form = await request.post()
+        # Uploaded files arrive as FileField; only their presence matters here
+        params = {key: value if isinstance(value, str) else "<file>" for key, value in form.items()}
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def handle_file(self, request):
+        self.calls["download"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.voice_file, content_type="audio/ogg")
+
+async def _serve(args):
+    server = FakeTelegramServer(host=args.host, port=args.port, latency=args.latency)
+    await server.start()
+    print(f"Fake Telegram Bot API listening on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Telegram Bot API stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
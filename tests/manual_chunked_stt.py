@@ -0,0 +1,130 @@
+"""
+Exercises chunked parallel transcription against the local stand-in server.
+Synthetic "speech" is a sequence of tone bursts, one pitch per word, with
+short gaps between words and longer pauses between sentences. The fake
+endpoint decodes the uploaded WAV back into words, so the stitched result
+can be checked word for word. Needs ffmpeg on PATH; no network or API keys.
+
+    python tests/manual_chunked_stt.py --seconds 120
+"""
+import argparse
+import asyncio
+import io
+import math
+import os
+import struct
+import sys
+import time
+import wave
+
+# Manually add src to path to import modules
+sys.path.append(os.path.join(os.getcwd(), ''))
+sys.path.append(os.path.join(os.getcwd(), 'tests'))
+
+os.environ.setdefault("GROQ_API_KEY", "fake")
+
+from openai import AsyncOpenAI
+from src.audio import AudioClient
+from src.silence import frame_levels
+from fake_openai import FakeOpenAIServer
+
+SAMPLE_RATE = 16000
+VOCABULARY = 40
+BASE_FREQUENCY = 300
+FREQUENCY_STEP = 100
+WORD_SECONDS = 0.3
+GAP_SECONDS = 0.12
+PAUSE_SECONDS = 0.6
+WORDS_PER_SENTENCE = 7
+
+def synth_speech(seconds):
+    """Returns (wav bytes, expected words)."""
+    samples = []
+    words = []
+    while len(samples) < seconds * SAMPLE_RATE:
+        index = len(words) % VOCABULARY
+        frequency = BASE_FREQUENCY + FREQUENCY_STEP * index
+        samples.extend(int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+                       for i in range(int(WORD_SECONDS * SAMPLE_RATE)))
+        words.append(f"w{index}")
+        gap = PAUSE_SECONDS if len(words) % WORDS_PER_SENTENCE == 0 else GAP_SECONDS
+        samples.extend([0] * int(gap * SAMPLE_RATE))
+    return to_wav(struct.pack(f"<{len(samples)}h", *samples)), words
+
+def to_wav(pcm):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+def fake_transcript(filename, audio):
+    """Decodes tone bursts back into words, skipping clipped fragments like a real model would."""
+    with wave.open(io.BytesIO(audio)) as wav:
+        rate = wav.getframerate()
+        pcm = wav.readframes(wav.getnframes())
+    samples = struct.unpack(f"<{len(pcm) // 2}h", pcm)
+    frame_ms = 10
+    frame = rate * frame_ms // 1000
+    voiced = [level > -40 for level in frame_levels(pcm, rate, frame_ms)] + [False]
+
+    words = []
+    start = None
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = i
+        elif not is_voiced and start is not None:
+            burst = samples[start * frame:i * frame]
+            start = None
+            if len(burst) < rate * 0.1:
+                continue
+            crossings = sum(1 for a, b in zip(burst, burst[1:]) if (a < 0) != (b < 0))
+            frequency = crossings * rate / len(burst) / 2
+            words.append(f"w{round((frequency - BASE_FREQUENCY) / FREQUENCY_STEP)}")
+    return " ".join(words)
+
+def make_client(server, chunking, max_parallel=4):
+    client = AudioClient()
+    client.client = AsyncOpenAI(base_url=server.base_url, api_key="fake", max_retries=0)
+    # WAV lets the fake endpoint decode what it receives
+    client.upload_format = "wav"
+    client.chunking_enabled = chunking
+    client.chunk_max_parallel = max_parallel
+    return client
+
+def accuracy(text, expected):
+    got = (text or "").split()
+    matched = sum(1 for a, b in zip(got, expected) if a == b)
+    return f"{len(got)} words, {matched}/{len(expected)} in place"
+
+async def run(args):
+    audio, expected = synth_speech(args.seconds)
+    print(f"--- {args.seconds}s of synthetic speech, {len(expected)} words, {len(audio) // 1024} KB ---\n")
+
+    server = await FakeOpenAIServer(transcript=fake_transcript, stt_seconds_per_mb=args.seconds_per_mb).start()
+
+    for label, chunking in (("Single request", False), ("Chunked", True)):
+        client = make_client(server, chunking)
+        before = server.requests
+        start = time.perf_counter()
+        text, _ = await client.transcribe(audio, input_format="wav")
+        print(f"{label}: {time.perf_counter() - start:.2f}s, {server.requests - before} request(s), "
+              f"{accuracy(text, expected)}")
+
+    # One chunk in three fails: the rest still comes back
+    server.error_rate = 0.33
+    client = make_client(server, True)
+    text, complete = await client.transcribe(audio, input_format="wav")
+    print(f"Chunked with failures: {client.stt_stats['chunk_failures']}/{client.stt_stats['chunks']} chunks failed, "
+          f"{accuracy(text, expected)}, complete={complete}")
+
+    await server.stop()
+    print("\n--- DONE ---")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked transcription against a local stand-in server")
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--seconds-per-mb", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
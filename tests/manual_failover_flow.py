@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import time
+
+# Manually add src to path to import modules
+sys.path.append(os.path.join(os.getcwd(), ''))
+sys.path.append(os.path.join(os.getcwd(), 'tests'))
+
+from src.config import LLM_CONFIG
+from src.llm import LLMClient, FALLBACK_RESPONSE
+from fake_openai import FakeOpenAIServer
+
+# Stand-in servers don't check keys
+os.environ.setdefault("FAKE_API_KEY", "fake")
+
+def make_config(*servers, hedging=None, retry=None, breaker=None):
+    config = dict(LLM_CONFIG)
+    config["providers"] = [
+        {"name": f"fake{i}", "base_url": s.base_url, "model": "fake-model", "api_key_env": "FAKE_API_KEY", "timeout": 5}
+        for i, s in enumerate(servers)
+    ]
+    config["retry"] = retry or {"attempts": 2, "base_delay": 0.05, "max_delay": 1}
+    config["hedging"] = hedging or {"enabled": False}
+    config["circuit_breaker"] = breaker or {"failure_threshold": 2, "reset_timeout": 60}
+    return config
+
+async def timed(label, coro):
+    start = time.perf_counter()
+    result = await coro
+    ok = "✅" if result != FALLBACK_RESPONSE else "❌"
+    print(f"{ok} {label}: {time.perf_counter() - start:.2f}s -> {result[:40]!r}")
+    return result
+
+async def collect(stream):
+    return "".join([chunk async for chunk in stream])
+
+async def run_scenarios():
+    print("--- STARTING FAILOVER SCENARIOS ---\n")
+    history = [{"role": "user", "content": "Сколько стоит бот?"}]
+
+    # 1. Primary always fails -> secondary answers
+    down = await FakeOpenAIServer(error_rate=1.0, error_status=503).start()
+    healthy = await FakeOpenAIServer().start()
+    llm = LLMClient(make_config(down, healthy))
+    await timed("Failover from 503 provider", llm.generate_response(history))
+
+    # 2. Breaker opens after two failures, primary is skipped afterwards
+    await timed("Second call (opens breaker)", llm.generate_response(history))
+    before = down.requests
+    await timed("Third call (primary skipped)", llm.generate_response(history))
+    print(f"   primary requests during third call: {down.requests - before}")
+
+    # 3. 429 with Retry-After is retried on the same provider
+    limited = await FakeOpenAIServer(error_rate=0.5, error_status=429, retry_after=0.2).start()
+    llm = LLMClient(make_config(limited))
+    for i in range(3):
+        await timed(f"Rate-limited provider #{i + 1}", llm.generate_response(history))
+    print(f"   requests: {limited.requests}, injected 429s: {limited.errors}")
+
+    # 4. Slow primary is hedged onto the secondary
+    slow = await FakeOpenAIServer(latency=2.0).start()
+    llm = LLMClient(make_config(slow, healthy, hedging={"enabled": True, "delay": 0.3}))
+    await timed("Hedged request (expect ~0.3s)", llm.generate_response(history))
+
+    # 5. Streaming fails over before the first chunk
+    llm = LLMClient(make_config(down, healthy, breaker={"failure_threshold": 100, "reset_timeout": 1}))
+    await timed("Streaming failover", collect(llm.stream_response(history)))
+
+    for server in (down, healthy, limited, slow):
+        await server.stop()
+    print("\n--- SCENARIOS COMPLETE ---")
+
+if __name__ == "__main__":
+    asyncio.run(run_scenarios())
@@ -0,0 +1,107 @@
+import pytest
+from src.booking import BookingExtractor, extract_booking, is_booking_confirmed
+
+BOOKING = '{"booking_confirmed": true, "name": "Иван", "contact": "+79990000000"}'
+
+REPLIES = [
+    "Просто ответ без JSON.",
+    f"Оформляю заявку!\n```json\n{BOOKING}\n```\nСпасибо!",
+    f"Оформляю заявку! json {BOOKING} Спасибо!",
+    f"Готово {BOOKING}",
+    'Заметка {"note": "a } b { c", "booking_confirmed": false} конец',
+    'Экранирование {"quote": "x\\"}\\\\", "n": 1} дальше',
+    'Шаблон {name} и {0} остаются',
+    'Вложенный {"a": {"b": [1, {"c": 2}]}} хвост',
+    'Обрыв {"booking_confirmed": true, "name": "Ив',
+    'Лишняя скобка {"a": 1}} после',
+    'Невалидный {"a": 1,} после',
+    f"Два объекта {BOOKING} и {{\"x\": 1}} конец",
+    "Почти fence `` и бэктики ``` без JSON",
+]
+
+def feed_chunks(text, chunks):
+    """Feeds text split at the given cut points; returns (streamed text, extractor)."""
+    extractor = BookingExtractor()
+    released = []
+    cuts = [0, *chunks, len(text)]
+    for start, end in zip(cuts, cuts[1:]):
+        released.append(extractor.feed(text[start:end]))
+    released.append(extractor.finish())
+    return "".join(released), extractor
+
+@pytest.mark.parametrize("text", REPLIES)
+def test_chunking_does_not_change_the_result(text):
+    whole = extract_booking(text)
+    for cut in range(1, len(text)):
+        streamed, extractor = feed_chunks(text, [cut])
+        assert streamed == whole.text
+        assert extractor.payloads == whole.payloads
+        assert extractor.hidden == whole.hidden
+
+@pytest.mark.parametrize("text", REPLIES)
+def test_character_by_character(text):
+    whole = extract_booking(text)
+    streamed, extractor = feed_chunks(text, range(1, len(text)))
+    assert streamed == extractor.text == whole.text
+    assert extractor.payloads == whole.payloads
+
+def test_fenced_booking_is_hidden_with_its_fence():
+    extractor = extract_booking(f"Оформляю заявку!\n```json\n{BOOKING}\n```\nСпасибо!")
+    assert extractor.text == "Оформляю заявку!\n\nСпасибо!"
+    assert extractor.booking["name"] == "Иван"
+    assert extractor.hidden == 1
+
+def test_prose_after_object_is_kept():
+    extractor = extract_booking(f"Готово {BOOKING} Ждём вас!")
+    assert extractor.text == "Готово Ждём вас!"
+    assert extractor.booking is not None
+
+def test_braces_inside_strings_do_not_end_the_object():
+    extractor = extract_booking('A {"note": "a } b { c", "q": "x\\"}"} B')
+    assert extractor.payloads == [{"note": "a } b { c", "q": 'x"}'}]
+    assert extractor.text == "A B"
+
+def test_template_braces_are_prose():
+    extractor = extract_booking("Шаблон {name} и {0} остаются")
+    assert extractor.text == "Шаблон {name} и {0} остаются"
+    assert extractor.hidden == 0
+
+def test_unterminated_object_is_withheld():
+    extractor = extract_booking('Обрыв {"booking_confirmed": true, "name": "Ив')
+    assert extractor.text == "Обрыв"
+    assert extractor.hidden == 1
+    assert extractor.booking is None
+
+def test_unbalanced_closing_brace_stays_visible():
+    extractor = extract_booking('До {"a": 1}} после')
+    assert extractor.payloads == [{"a": 1}]
+    assert extractor.text == "До} после"
+
+def test_invalid_json_is_hidden_but_not_parsed():
+    extractor = extract_booking('Невалидный {"a": 1,} после')
+    assert extractor.text == "Невалидный после"
+    assert extractor.payloads == []
+    assert extractor.hidden == 1
+
+def test_trailing_json_without_prose():
+    extractor = extract_booking(f"Готово {BOOKING}")
+    assert extractor.text == "Готово"
+    assert extractor.booking is not None
+
+def test_first_confirmed_payload_wins():
+    extractor = extract_booking('{"booking_confirmed": false} {"booking_confirmed": "True", "n": 2}')
+    assert extractor.booking == {"booking_confirmed": "True", "n": 2}
+
+@pytest.mark.parametrize("data, confirmed", [
+    ({"booking_confirmed": True}, True),
+    ({"booking_confirmed": "TRUE"}, True),
+    ({"bookingconfirmed": "true"}, True),
+    ({"booking_confirmed": False}, False),
+    ({"booking_confirmed": "false"}, False),
+    ({"booking_confirmed": 1}, False),
+    ({}, False),
+    (["booking_confirmed"], False),
+    (None, False),
+])
+def test_is_booking_confirmed(data, confirmed):
+    assert is_booking_confirmed(data) is confirmed
@@ -0,0 +1,72 @@
+import pytest
+from src.text import sanitize_reply, strip_markdown, clean_markdown_for_tts
+
+# Nested, unclosed and otherwise awkward Markdown an LLM actually produces
+EDGE_CASES = [
+    "**bold _nested_ text**",
+    "**unclosed bold",
+    "_a *b_ c*",
+    "```py\nx = [1]\nunclosed fence",
+    "`unclosed code",
+    "[label](http://x_y.com)",
+    "[unclosed](link",
+    "[**bold label**](http://example.com)",
+    "# Title\n* item\n1. one",
+    "* **Bold** item",
+    "snake_case and a_b_c",
+    "``",
+    "****",
+    "Привет 👋🏽 мир 🇷🇺",
+]
+
+def test_empty():
+    assert sanitize_reply("") == ("", "")
+    assert sanitize_reply(None) == ("", "")
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_plain_is_strip_markdown(text):
+    # The plain output only drops syntax characters, however broken the Markdown is
+    assert sanitize_reply(text)[0] == strip_markdown(text)
+
+@pytest.mark.parametrize("text", EDGE_CASES)
+def test_tts_has_no_markdown_characters(text):
+    assert not set(sanitize_reply(text)[1]) & set("*_`[]")
+
+@pytest.mark.parametrize("text, tts", [
+    ("**bold _nested_ text**", "bold nested text"),
+    ("**unclosed bold", "unclosed bold"),
+    ("_a *b_ c*", "a b c"),
+    ("`unclosed code", "unclosed code"),
+    ("Run `pip install x` now", "Run pip install x now"),
+    ("[**bold label**](http://example.com)", "bold label"),
+    ("[unclosed](link", "unclosed(link"),
+    ("# Title\n* item\n- dash\n1. one", "Title\nitem\ndash\none"),
+])
+def test_tts_text(text, tts):
+    assert sanitize_reply(text)[1] == tts
+
+def test_closed_fence_is_not_spoken():
+    plain, tts = sanitize_reply("Код:\n```python\nprint('hi')\n```\nГотово")
+    assert "print('hi')" in plain
+    assert tts == "Код:\n\nГотово"
+
+def test_unclosed_fence_is_kept_as_text():
+    # Without a closing fence there is no code block: only the backticks go
+    assert sanitize_reply("```py\nx = [1]\nunclosed fence")[1] == "py\nx = 1\nunclosed fence"
+
+def test_link_target_kept_in_plain_only():
+    plain, tts = sanitize_reply("См. [портфолио](https://example.com/portfolio_2024).")
+    assert plain == "См. портфолио(https://example.com/portfolio2024)."
+    assert tts == "См. портфолио."
+
+def test_emoji_removed_from_tts_only():
+    plain, tts = sanitize_reply("Привет 👋🏽 мир 🇷🇺 ❤️ 👨‍💻")
+    assert plain == "Привет 👋🏽 мир 🇷🇺 ❤️ 👨‍💻"
+    assert tts == "Привет  мир"
+
+def test_emoji_inside_link_label_removed_from_tts():
+    assert sanitize_reply("[🚀 Старт](http://x)")[1] == "Старт"
+
+def test_wrappers():
+    text = "**Цена** — от 15 000 ₽ ✅"
+    assert clean_markdown_for_tts(text) == sanitize_reply(text)[1] == "Цена — от 15 000 ₽"
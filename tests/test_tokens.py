@@ -0,0 +1,66 @@
+from src.tokens import estimate_tokens, message_tokens, trim_history, MESSAGE_OVERHEAD
+
+def user(text):
+    return {"role": "user", "content": text}
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+def system(text):
+    return {"role": "system", "content": text}
+
+def test_estimate_tokens_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hi, you!") == 4
+    # Long ASCII words split every 4 characters, Cyrillic every 3
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("привет") == 2
+
+def test_message_tokens_adds_overhead_and_handles_missing_content():
+    assert message_tokens({"role": "user", "content": None}) == MESSAGE_OVERHEAD
+    assert message_tokens(user("hi")) == MESSAGE_OVERHEAD + 1
+
+def test_everything_fits():
+    history = [user("one"), assistant("two"), user("three")]
+    assert trim_history(history, budget=1000) == history
+
+def test_keeps_newest_messages_within_budget():
+    history = [user(f"m{i}") for i in range(10)]
+    cost = message_tokens(history[0])
+    assert trim_history(history, budget=3 * cost) == history[-3:]
+    # One token short of three messages
+    assert trim_history(history, budget=3 * cost - 1) == history[-2:]
+
+def test_stops_at_first_message_that_does_not_fit():
+    # A short older message must not be kept once a newer, longer one was dropped
+    history = [user("a"), user("word " * 50), user("b")]
+    assert trim_history(history, budget=2 * message_tokens(user("a"))) == [user("b")]
+
+def test_leading_system_messages_are_pinned():
+    note = system("contact note " * 20)
+    history = [note, user("old " * 20), user("new")]
+    trimmed = trim_history(history, budget=message_tokens(note) + message_tokens(user("new")))
+    assert trimmed == [note, user("new")]
+
+def test_only_leading_system_messages_are_pinned():
+    history = [system("pinned"), user("old " * 20), system("later note " * 20), user("new")]
+    trimmed = trim_history(history, budget=message_tokens(history[0]) + message_tokens(user("new")))
+    assert trimmed == [system("pinned"), user("new")]
+
+def test_pinned_messages_are_kept_even_over_budget():
+    note = system("contact " * 100)
+    history = [note, user("hi")]
+    assert trim_history(history, budget=1) == history
+
+def test_min_messages_are_kept_even_over_budget():
+    history = [user("old"), user("long " * 100), user("longer " * 100)]
+    assert trim_history(history, budget=1) == history[-1:]
+    assert trim_history(history, budget=1, min_messages=2) == history[-2:]
+    assert trim_history(history, budget=1, min_messages=0) == []
+
+def test_min_messages_larger_than_history():
+    history = [system("note"), user("hi")]
+    assert trim_history(history, budget=0, min_messages=5) == history
+
+def test_empty_history():
+    assert trim_history([], budget=100) == []